@@ -4,11 +4,32 @@ Performance Monitor for Voice Assistant API
 Tracks response times and helps identify bottlenecks
 """
 
+import asyncio
 import time
-import requests
+import httpx
 import json
 import statistics
 from datetime import datetime
+from io import BytesIO
+
+async def _time_get(client, url, **kwargs):
+    """Issue a GET and return (response, elapsed milliseconds)"""
+    start = time.perf_counter_ns()
+    response = await client.get(url, **kwargs)
+    return response, (time.perf_counter_ns() - start) / 1e6
+
+async def _time_post(client, url, **kwargs):
+    """Issue a POST and return (response, elapsed milliseconds)"""
+    start = time.perf_counter_ns()
+    response = await client.post(url, **kwargs)
+    return response, (time.perf_counter_ns() - start) / 1e6
+
+def _percentiles(samples):
+    """Return the (p50, p90, p99) latencies of the samples"""
+    if len(samples) < 2:
+        return samples[0], samples[0], samples[0]
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[89], cuts[98]
 
 class PerformanceMonitor:
     def __init__(self, base_url="http://localhost:5000"):
@@ -18,132 +39,153 @@ class PerformanceMonitor:
             'start_conversation': [],
             'process_user_input': []
         }
+        # Synthesized test WAV bytes keyed by duration
+        self._test_wav_bytes = {}
     
-    def test_health_endpoint(self, iterations=5):
+    async def test_health_endpoint(self, iterations=5):
         """Test health endpoint response time"""
         print("🏥 Testing health endpoint...")
         times = []
         
-        for i in range(iterations):
-            start_time = time.time()
-            try:
-                response = requests.get(f"{self.base_url}/health", timeout=10)
-                end_time = time.time()
-                response_time = (end_time - start_time) * 1000  # Convert to milliseconds
-                times.append(response_time)
-                print(f"  Health check {i+1}: {response_time:.2f}ms")
-            except Exception as e:
-                print(f"  Health check {i+1}: ERROR - {e}")
+        # Dispatch all iterations concurrently to also measure behaviour under load
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=10) as client:
+            results = await asyncio.gather(
+                *[_time_get(client, "/health") for _ in range(iterations)],
+                return_exceptions=True
+            )
+        
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"  Health check {i+1}: ERROR - {result}")
+                continue
+            response, response_time = result
+            times.append(response_time)
+            print(f"  Health check {i+1}: {response_time:.2f}ms")
         
         if times:
             avg_time = statistics.mean(times)
             min_time = min(times)
             max_time = max(times)
+            p50, p90, p99 = _percentiles(times)
             print(f"  📊 Health endpoint - Avg: {avg_time:.2f}ms, Min: {min_time:.2f}ms, Max: {max_time:.2f}ms")
+            print(f"     p50: {p50:.2f}ms, p90: {p90:.2f}ms, p99: {p99:.2f}ms")
             self.response_times['health'].extend(times)
     
-    def test_start_conversation(self, iterations=3):
+    async def test_start_conversation(self, iterations=3):
         """Test start conversation endpoint response time"""
         print("🎤 Testing start conversation endpoint...")
         times = []
         
-        for i in range(iterations):
-            start_time = time.time()
-            try:
-                response = requests.post(
-                    f"{self.base_url}/api/start_conversation",
-                    json={"language": "English"},
-                    timeout=30
-                )
-                end_time = time.time()
-                response_time = (end_time - start_time) * 1000
-                times.append(response_time)
-                print(f"  Start conversation {i+1}: {response_time:.2f}ms")
-            except Exception as e:
-                print(f"  Start conversation {i+1}: ERROR - {e}")
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=30) as client:
+            results = await asyncio.gather(
+                *[_time_post(client, "/api/start_conversation", json={"language": "English"})
+                  for _ in range(iterations)],
+                return_exceptions=True
+            )
+        
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"  Start conversation {i+1}: ERROR - {result}")
+                continue
+            response, response_time = result
+            times.append(response_time)
+            print(f"  Start conversation {i+1}: {response_time:.2f}ms")
         
         if times:
             avg_time = statistics.mean(times)
             min_time = min(times)
             max_time = max(times)
+            p50, p90, p99 = _percentiles(times)
             print(f"  📊 Start conversation - Avg: {avg_time:.2f}ms, Min: {min_time:.2f}ms, Max: {max_time:.2f}ms")
+            print(f"     p50: {p50:.2f}ms, p90: {p90:.2f}ms, p99: {p99:.2f}ms")
             self.response_times['start_conversation'].extend(times)
     
     def generate_test_audio(self, duration_seconds=3):
         """Generate a simple test audio file for testing"""
+        with open('test_audio.wav', 'wb') as wav_out:
+            wav_out.write(self._synthesize_test_wav(duration_seconds))
+        
+        return 'test_audio.wav'
+    
+    def _synthesize_test_wav(self, duration_seconds):
+        """Return WAV bytes for a sine test tone, synthesized once per duration"""
+        cached = self._test_wav_bytes.get(duration_seconds)
+        if cached is not None:
+            return cached
+        
         import numpy as np
         import wave
         
-        # Generate a simple sine wave
+        # Generate a simple sine wave straight into 16-bit PCM
         sample_rate = 16000
         frequency = 440  # A4 note
         samples = int(sample_rate * duration_seconds)
-        t = np.linspace(0, duration_seconds, samples)
-        audio_data = np.sin(2 * np.pi * frequency * t) * 0.3
+        t = np.arange(samples, dtype=np.float32) * np.float32(2 * np.pi * frequency / sample_rate)
+        audio_data = (np.sin(t) * np.float32(0.3 * 32767)).astype(np.int16)
         
-        # Convert to 16-bit PCM
-        audio_data = (audio_data * 32767).astype(np.int16)
-        
-        # Save as WAV file
-        with wave.open('test_audio.wav', 'w') as wav_file:
+        buffer = BytesIO()
+        with wave.open(buffer, 'wb') as wav_file:
             wav_file.setnchannels(1)
             wav_file.setsampwidth(2)
             wav_file.setframerate(sample_rate)
             wav_file.writeframes(audio_data.tobytes())
         
-        return 'test_audio.wav'
+        self._test_wav_bytes[duration_seconds] = buffer.getvalue()
+        return self._test_wav_bytes[duration_seconds]
     
-    def test_process_user_input(self, iterations=3):
+    async def test_process_user_input(self, iterations=3):
         """Test process user input endpoint response time"""
         print("🎵 Testing process user input endpoint...")
         times = []
         
-        # Generate test audio
-        test_audio_file = self.generate_test_audio(2)
-        
-        for i in range(iterations):
-            start_time = time.time()
-            try:
-                with open(test_audio_file, 'rb') as audio_file:
-                    files = {'audio': ('test.wav', audio_file, 'audio/wav')}
-                    data = {'language': 'English'}
-                    
-                    response = requests.post(
-                        f"{self.base_url}/api/process_user_input",
-                        files=files,
-                        data=data,
-                        timeout=60
-                    )
-                
-                end_time = time.time()
-                response_time = (end_time - start_time) * 1000
-                times.append(response_time)
-                print(f"  Process user input {i+1}: {response_time:.2f}ms")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('status') == 'success':
-                        print(f"    ✅ Success - User: '{result.get('user_input', 'N/A')[:50]}...'")
-                    else:
-                        print(f"    ❌ Error: {result.get('message', 'Unknown error')}")
+        # Generate test audio in memory once; each task gets its own view of the bytes
+        wav_bytes = self._synthesize_test_wav(2)
+        data = {'language': 'English'}
+        
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60) as client:
+            results = await asyncio.gather(
+                *[_time_post(client, "/api/process_user_input",
+                             files={'audio': ('test.wav', BytesIO(wav_bytes), 'audio/wav')},
+                             data=data)
+                  for _ in range(iterations)],
+                return_exceptions=True
+            )
+        
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"  Process user input {i+1}: ERROR - {result}")
+                continue
+            response, response_time = result
+            times.append(response_time)
+            print(f"  Process user input {i+1}: {response_time:.2f}ms")
+            
+            if response.status_code == 200:
+                body = response.json()
+                if body.get('status') == 'success':
+                    print(f"    ✅ Success - User: '{body.get('user_input', 'N/A')[:50]}...'")
                 else:
-                    print(f"    ❌ HTTP Error: {response.status_code}")
-                    
-            except Exception as e:
-                print(f"  Process user input {i+1}: ERROR - {e}")
-        
-        # Clean up test file
-        import os
-        if os.path.exists(test_audio_file):
-            os.remove(test_audio_file)
+                    print(f"    ❌ Error: {body.get('message', 'Unknown error')}")
+            else:
+                print(f"    ❌ HTTP Error: {response.status_code}")
         
         if times:
             avg_time = statistics.mean(times)
             min_time = min(times)
             max_time = max(times)
+            p50, p90, p99 = _percentiles(times)
             print(f"  📊 Process user input - Avg: {avg_time:.2f}ms, Min: {min_time:.2f}ms, Max: {max_time:.2f}ms")
+            print(f"     p50: {p50:.2f}ms, p90: {p90:.2f}ms, p99: {p99:.2f}ms")
             self.response_times['process_user_input'].extend(times)
     
+    async def _run_endpoint_tests(self):
+        """Run the endpoint tests on a single event loop"""
+        await self.test_health_endpoint(5)
+        print()
+        await self.test_start_conversation(3)
+        print()
+        await self.test_process_user_input(3)
+        print()
+    
     def run_full_test(self):
         """Run complete performance test suite"""
         print("=" * 60)
@@ -154,12 +196,7 @@ class PerformanceMonitor:
         print("=" * 60)
         
         # Test all endpoints
-        self.test_health_endpoint(5)
-        print()
-        self.test_start_conversation(3)
-        print()
-        self.test_process_user_input(3)
-        print()
+        asyncio.run(self._run_endpoint_tests())
         
         # Summary
         print("=" * 60)
@@ -171,9 +208,11 @@ class PerformanceMonitor:
                 avg_time = statistics.mean(times)
                 min_time = min(times)
                 max_time = max(times)
+                p50, p90, p99 = _percentiles(times)
                 print(f"🎯 {endpoint.replace('_', ' ').title()}:")
                 print(f"   Average: {avg_time:.2f}ms")
                 print(f"   Range: {min_time:.2f}ms - {max_time:.2f}ms")
+                print(f"   p50: {p50:.2f}ms, p90: {p90:.2f}ms, p99: {p99:.2f}ms")
                 print()
         
         print("=" * 60)
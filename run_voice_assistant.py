@@ -2,14 +2,16 @@
 
 import logging
 import time
+from functools import lru_cache
 from colorama import Fore, init
-from voice_assistant.audio import record_audio, play_audio
+from voice_assistant.audio import record_audio, play_audio, play_pcm
 from voice_assistant.transcription import transcribe_audio
 from voice_assistant.response_generation import generate_response
 from voice_assistant.text_to_speech import text_to_speech
 from voice_assistant.utils import delete_file
 from voice_assistant.config import Config
 from voice_assistant.api_key_manager import get_transcription_api_key, get_response_api_key, get_tts_api_key
+from voice_assistant.optimized_tts import tts_pcm_with_cached_deepgram
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,6 +21,13 @@ init(autoreset=True)
 
 import threading
 
+@lru_cache(maxsize=None)
+def get_deepgram_client(api_key):
+    """
+    Return a cached Deepgram client so every turn reuses its connection
+    """
+    from deepgram import DeepgramClient
+    return DeepgramClient(api_key)
 
 def main():
     """
@@ -66,28 +75,33 @@ def main():
             # Append the assistant's response to the chat history
             chat_history.append({"role": "assistant", "content": response_text})
 
-            # Determine the output file format based on the TTS model
-            if Config.TTS_MODEL == 'openai' or Config.TTS_MODEL == 'elevenlabs' or Config.TTS_MODEL == 'melotts' or Config.TTS_MODEL == 'cartesia':
-                output_file = 'output.mp3'
-            else:
-                output_file = 'output.wav'
-
             # Get the API key for TTS
             tts_api_key = get_tts_api_key()
 
-            # Convert the response text to speech and save it to the appropriate file
-            text_to_speech(Config.TTS_MODEL, tts_api_key, response_text, output_file, Config.LOCAL_MODEL_PATH)
-
-            # Play the generated speech audio
-            if Config.TTS_MODEL=="cartesia":
-                pass
+            if Config.TTS_MODEL == 'deepgram':
+                # Play Deepgram's raw PCM straight from memory; no output file to write
+                play_pcm(tts_pcm_with_cached_deepgram(get_deepgram_client(tts_api_key), response_text))
             else:
-                play_audio(output_file)
+                # Determine the output file format based on the TTS model
+                if Config.TTS_MODEL == 'openai' or Config.TTS_MODEL == 'elevenlabs' or Config.TTS_MODEL == 'melotts' or Config.TTS_MODEL == 'cartesia':
+                    output_file = 'output.mp3'
+                else:
+                    output_file = 'output.wav'
+
+                # Convert the response text to speech and save it to the appropriate file
+                text_to_speech(Config.TTS_MODEL, tts_api_key, response_text, output_file, Config.LOCAL_MODEL_PATH)
+
+                # Play the generated speech audio
+                if Config.TTS_MODEL=="cartesia":
+                    pass
+                else:
+                    play_audio(output_file)
             
             # Clean up audio files with delay to avoid permission errors
             time.sleep(0.5)  # Wait for audio playback to finish
             delete_file(input_audio_file)
-            delete_file(output_file)
+            if output_file:
+                delete_file(output_file)
 
         except Exception as e:
             logging.error(Fore.RED + f"An error occurred: {e}" + Fore.RESET)
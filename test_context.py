@@ -5,7 +5,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from voice_assistant.optimized_response import generate_response_with_cached_groq, _is_follow_up_about_properties
+from voice_assistant.optimized_response import generate_response_with_cached_groq, _is_follow_up_about_properties, _scan_history
 from voice_assistant.property_kb_handler import PropertyKBHandler
 
 def test_context_handling():
@@ -27,7 +27,8 @@ def test_context_handling():
     
     # Test the follow-up detection
     user_message = "Are you the only one of them?"
-    is_follow_up = _is_follow_up_about_properties(user_message, chat_history)
+    _, last_assistant, recent_assistant = _scan_history(chat_history)
+    is_follow_up = _is_follow_up_about_properties(user_message.lower(), last_assistant, recent_assistant)
     print(f"User message: '{user_message}'")
     print(f"Is follow-up about properties: {is_follow_up}")
     print()
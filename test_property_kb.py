@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# test_property_kb.py
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from voice_assistant.property_kb_handler import (
+    PropertyKBHandler, _compile_keywords, _PRICE_RE, _BUDGET_RE, _PRICE_VAL_RE,
+    _ALL_QUERIES, _DETAIL_KEYWORDS, _FOLLOW_UP_KEYWORDS, _GENERAL_KEYWORDS, _EMOTIONAL_KEYWORDS
+)
+
+KB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'KB', 'uae_property_kb.json')
+
+# Fixed queries covering locations, abbreviations, features, prices, budgets,
+# greetings, follow-ups and keywords hidden inside longer words
+QUERIES = [
+    "all properties", "show all", "everything", "", "random words here",
+    "dubai marina", "Palm Jumeirah please", "jbr", "JBR apartments", "downtown", "ali",
+    "emirates hills", "something in the hills", "palm jebel ali or arabian ranches",
+    "villa with pool", "Golf course view", "sea view", "i want a garden", "2br", "3 bedroom villa",
+    "something for 2.5m aed", "3.8 million dirhams", "3 million budget", "5 max", "around 4m around",
+    "hello", "hi there", "history of the area", "thanks that's nice", "what is the weather",
+    "how are you", "okay", "ok", "tell me more", "are you the only one", "is that all",
+    "what else do you have", "show me other areas", "anything else", "those look good",
+    "withhold", "thistle", "shipping", "bye for now", "goodbye", "nothing else thanks",
+    "accounting services pricing", "not bad at all", "pretty good, what about downtown",
+]
+
+def _linear_search(kb, query):
+    """search_properties as a linear scan over every property and keyword"""
+    query_lower = query.lower()
+    if query_lower in _ALL_QUERIES:
+        return [prop['_key'] for prop in kb.properties]
+
+    matching = []
+    for prop in kb.properties:
+        location = prop['location'].lower()
+        if location in kb.location_keywords and any(keyword in query_lower for keyword in kb.location_keywords[location]):
+            matching.append(prop)
+        if location in query_lower:
+            matching.append(prop)
+
+    seen = set()
+    unique = []
+    for prop in matching:
+        if prop['_key'] not in seen:
+            seen.add(prop['_key'])
+            unique.append(prop)
+
+    if not unique:
+        unique = [prop for prop in kb.properties if any(word in prop['features'].lower() for word in query_lower.split())]
+
+    if not unique:
+        price_matches = _PRICE_RE.findall(query_lower)
+        if price_matches:
+            unique = [prop for prop in kb.properties if any(price in prop['price'].lower() for price in price_matches)]
+
+    if not unique:
+        budget_matches = _BUDGET_RE.findall(query_lower)
+        if budget_matches:
+            budget_limit = float(budget_matches[0])
+            for prop in kb.properties:
+                price_match = _PRICE_VAL_RE.search(prop['price'])
+                if price_match and float(price_match.group(1)) <= budget_limit:
+                    unique.append(prop)
+
+    return [prop['_key'] for prop in unique]
+
+def _linear_is_property_related(kb, query):
+    """is_property_related_query as a substring scan over each keyword list"""
+    query_lower = query.lower()
+    return any(
+        keyword in query_lower
+        for keywords in (kb.property_keywords, _DETAIL_KEYWORDS, _FOLLOW_UP_KEYWORDS)
+        for keyword in keywords
+    )
+
+def _linear_is_general(query):
+    """is_greeting_or_general_query as a substring scan over each keyword list"""
+    query_lower = query.lower()
+    return any(keyword in query_lower for keyword in _GENERAL_KEYWORDS | _EMOTIONAL_KEYWORDS)
+
+def test_compiled_keywords_match_linear_scan():
+    """The trie-compiled pattern finds the same keywords as a substring scan"""
+    keywords = ['it', 'its', 'item', 'them', 'the', 'that', "that's it", 'hi', 'his', 'jbr', 'palm', 'palm jebel ali']
+    texts = ['', 'items', "that's it then", 'the theme', 'this', 'palm jebel ali', 'a jbr flat', 'nothing', 'his itinerary']
+    plain = _compile_keywords(keywords)
+    overlapping = _compile_keywords(keywords, overlapping=True)
+    for text in texts:
+        assert (plain.search(text) is not None) == any(keyword in text for keyword in keywords), text
+
+        # Overlapping mode reports, at every position, the longest keyword starting there
+        expected = []
+        for start in range(len(text)):
+            starting_here = [keyword for keyword in keywords if text.startswith(keyword, start)]
+            if starting_here:
+                expected.append(max(starting_here, key=len))
+        assert [match.group(1) for match in overlapping.finditer(text)] == expected, text
+
+    assert _compile_keywords([]).search('anything') is None
+
+def test_queries_match_linear_scan():
+    """search_properties and intent detection agree with the linear scans on fixed queries"""
+    kb = PropertyKBHandler(KB_FILE)
+    assert kb.properties, "property KB did not load"
+
+    for query in QUERIES:
+        # Twice, so the cached results are checked as well
+        for _ in range(2):
+            assert [prop['_key'] for prop in kb.search_properties(query)] == _linear_search(kb, query), query
+            assert kb.is_property_related_query(query) == _linear_is_property_related(kb, query), query
+            assert kb.is_greeting_or_general_query(query) == _linear_is_general(query), query
+
+def test_bedroom_labels():
+    """'2BR' style features are labelled by bedrooms, not as a plain apartment"""
+    assert PropertyKBHandler._extract_bhk_from_features("2BR, Sea View, Gym, Pool") == "2 bhk"
+    assert PropertyKBHandler._extract_bhk_from_features("Studio 1br") == "1 bhk"
+    assert PropertyKBHandler._extract_bhk_from_features("4 Bedroom Villa, Garden") == "4 bhk"
+
+    kb = PropertyKBHandler(KB_FILE)
+    response = kb.format_property_response(kb.search_properties("dubai marina"))
+    assert "2 bhk" in response, response
+
+if __name__ == "__main__":
+    test_compiled_keywords_match_linear_scan()
+    test_queries_match_linear_scan()
+    test_bedroom_labels()
+    print("Property KB regression checks passed!")
@@ -4,16 +4,30 @@ import speech_recognition as sr
 import pygame
 import time
 import logging
-import pydub
-from io import BytesIO
-from pydub import AudioSegment
+import subprocess
 from functools import lru_cache
 import os
 import wave
+import atexit
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Whether the pygame mixer has been opened; it stays open between plays
+_mixer_ready = False
+
+# Mixer format raw PCM playback needs (16 kHz, signed 16-bit, mono), and whether
+# the open mixer is currently pinned to it
+PCM_MIXER_FORMAT = (16000, -16, 1)
+_mixer_pinned = False
+
+# Event posted by pygame when music playback ends, and whether the event queue is usable
+_MUSIC_END = pygame.USEREVENT + 1
+_events_ready = False
+
+# Whether the open microphone has been calibrated for ambient noise
+_calibrated = False
+
 @lru_cache(maxsize=None)
 def get_recognizer():
     """
@@ -21,6 +35,32 @@ def get_recognizer():
     """
     return sr.Recognizer()
 
+@lru_cache(maxsize=None)
+def get_microphone():
+    """
+    Return a cached microphone source whose PortAudio stream stays open
+    """
+    microphone = sr.Microphone()
+    source = microphone.__enter__()
+    atexit.register(microphone.__exit__, None, None, None)
+    return source
+
+def _reset_microphone():
+    """
+    Close the cached microphone stream so the next get_microphone() call reopens the device
+    """
+    global _calibrated
+    if get_microphone.cache_info().currsize:
+        microphone = get_microphone()
+        atexit.unregister(microphone.__exit__)
+        try:
+            microphone.__exit__(None, None, None)
+        except Exception as e:
+            logging.warning(f"Error closing microphone stream: {e}")
+        get_microphone.cache_clear()
+    # A reopened (possibly different) device gets a fresh calibration
+    _calibrated = False
+
 def record_audio(file_path, timeout=10, phrase_time_limit=None, retries=3, energy_threshold=2000, 
                  pause_threshold=1, phrase_threshold=0.1, dynamic_energy_threshold=True, 
                  calibration_duration=1):
@@ -37,55 +77,72 @@ def record_audio(file_path, timeout=10, phrase_time_limit=None, retries=3, energ
     phrase_threshold (float): Minimum length of a phrase to consider for recording (in seconds).
     dynamic_energy_threshold (bool): Whether to enable dynamic energy threshold adjustment.
     calibration_duration (float): Duration of the ambient noise calibration (in seconds).
+        Calibration only runs when the microphone is opened; later calls keep the
+        threshold as the recognizer has adapted it since.
     """
+    global _calibrated
     recognizer = get_recognizer()
-    recognizer.energy_threshold = energy_threshold
     recognizer.pause_threshold = pause_threshold
     recognizer.phrase_threshold = phrase_threshold
     recognizer.dynamic_energy_threshold = dynamic_energy_threshold
     
     for attempt in range(retries):
         try:
-            with sr.Microphone() as source:
+            source = get_microphone()
+            if not _calibrated:
                 logging.info("Calibrating for ambient noise...")
+                recognizer.energy_threshold = energy_threshold
                 recognizer.adjust_for_ambient_noise(source, duration=calibration_duration)
-                logging.info("Recording started")
-                # Listen for the first phrase and extract it into audio data
-                audio_data = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
-                logging.info("Recording complete")
+                _calibrated = True
+            logging.info("Recording started")
+            # Listen for the first phrase and extract it into audio data
+            audio_data = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+            logging.info("Recording complete")
 
-                # Convert the recorded audio data to a file
-                wav_data = audio_data.get_wav_data()
-                
-                # Ensure the directory exists
-                os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else '.', exist_ok=True)
-                
-                # Determine file format based on extension
-                if file_path.lower().endswith('.mp3'):
-                    # Try to save as MP3, fallback to WAV if FFmpeg not available
-                    try:
-                        audio_segment = pydub.AudioSegment.from_wav(BytesIO(wav_data))
-                        audio_segment.export(file_path, format="mp3", bitrate="128k")
-                        logging.info(f"Audio saved as MP3: {file_path}")
-                    except Exception as mp3_error:
-                        logging.warning(f"Failed to save as MP3: {mp3_error}")
-                        # Fallback to WAV
-                        wav_path = file_path.replace('.mp3', '.wav')
-                        with open(wav_path, 'wb') as f:
-                            f.write(wav_data)
-                        logging.info(f"Audio saved as WAV: {wav_path}")
-                        # Update the file path for the rest of the process
-                        file_path = wav_path
-                else:
-                    # Save as WAV directly
-                    with open(file_path, 'wb') as f:
+            # Convert the recorded audio data to a file
+            wav_data = audio_data.get_wav_data()
+            
+            # Ensure the directory exists
+            os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else '.', exist_ok=True)
+            
+            # Determine file format based on extension
+            if file_path.lower().endswith('.mp3'):
+                # Encode to MP3 with a single FFmpeg pass fed from memory, fallback to WAV if unavailable
+                try:
+                    proc = subprocess.Popen(
+                        ['ffmpeg', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+                         '-codec:a', 'libmp3lame', '-b:a', '128k', '-y', file_path],
+                        stdin=subprocess.PIPE
+                    )
+                    proc.communicate(wav_data)
+                    if proc.returncode != 0:
+                        raise RuntimeError(f"ffmpeg exited with code {proc.returncode}")
+                    logging.info(f"Audio saved as MP3: {file_path}")
+                except Exception as mp3_error:
+                    logging.warning(f"Failed to save as MP3: {mp3_error}")
+                    # Fallback to WAV
+                    wav_path = file_path.replace('.mp3', '.wav')
+                    with open(wav_path, 'wb') as f:
                         f.write(wav_data)
-                    logging.info(f"Audio saved as WAV: {file_path}")
+                    logging.info(f"Audio saved as WAV: {wav_path}")
+                    # Update the file path for the rest of the process
+                    file_path = wav_path
+            else:
+                # Save as WAV directly
+                with open(file_path, 'wb') as f:
+                    f.write(wav_data)
+                logging.info(f"Audio saved as WAV: {file_path}")
+            
+            return
                 
-                return
-                    
         except sr.WaitTimeoutError:
             logging.warning(f"Listening timed out, retrying... ({attempt + 1}/{retries})")
+        except OSError as e:
+            # The stream broke or the device went away; reopen it on the next attempt
+            logging.error(f"Microphone stream error: {e}")
+            _reset_microphone()
+            if attempt == retries - 1:
+                raise
         except Exception as e:
             logging.error(f"Failed to record audio: {e}")
             if attempt == retries - 1:
@@ -93,6 +150,43 @@ def record_audio(file_path, timeout=10, phrase_time_limit=None, retries=3, energ
         
     logging.error("Recording failed after all retries")
 
+def _ensure_mixer(pcm=False):
+    """
+    Initialize the pygame mixer and keep it open until interpreter exit.
+    
+    Files play through the device's default format so SDL does not resample or
+    downmix them. Raw PCM has no header to describe it, so for pcm=True the mixer
+    is pinned to PCM_MIXER_FORMAT instead; the mixer is only reopened when
+    playback switches between the two.
+    
+    Args:
+    pcm (bool): Whether the mixer is about to play raw PCM.
+    """
+    global _mixer_ready, _mixer_pinned, _events_ready
+    if pygame.mixer.get_init() is not None:
+        if _mixer_pinned == pcm:
+            return
+        pygame.mixer.quit()
+    
+    if pcm:
+        frequency, size, channels = PCM_MIXER_FORMAT
+        # allowedchanges=0 makes SDL convert for the device instead of changing the format
+        pygame.mixer.init(frequency=frequency, size=size, channels=channels, buffer=512, allowedchanges=0)
+    else:
+        pygame.mixer.init()
+    _mixer_pinned = pcm
+    pygame.mixer.music.set_endevent(_MUSIC_END)
+    
+    if not _mixer_ready:
+        atexit.register(pygame.mixer.quit)
+        try:
+            # The event queue lives in the video subsystem; headless hosts fall back to polling
+            pygame.display.init()
+            _events_ready = True
+        except pygame.error as e:
+            logging.warning(f"Pygame event queue unavailable, polling for playback end: {e}")
+        _mixer_ready = True
+
 def play_audio(file_path):
     """
     Play an audio file using pygame.
@@ -101,14 +195,36 @@ def play_audio(file_path):
     file_path (str): The path to the audio file to play.
     """
     try:
-        pygame.mixer.init()
+        _ensure_mixer()
         pygame.mixer.music.load(file_path)
+        if _events_ready:
+            pygame.event.clear(_MUSIC_END)
         pygame.mixer.music.play()
         while pygame.mixer.music.get_busy():
-            pygame.time.wait(100)
+            if _events_ready:
+                # Wake as soon as the end-event is posted; the timeout is only a safety net
+                pygame.event.wait(100)
+            else:
+                pygame.time.wait(100)
+    except pygame.error as e:
+        logging.error(f"Failed to play audio: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while playing audio: {e}")
+
+def play_pcm(pcm_bytes):
+    """
+    Play raw 16 kHz mono 16-bit PCM audio from memory using pygame.
+    
+    Args:
+    pcm_bytes (bytes): The PCM audio, e.g. from optimized_tts.tts_pcm_with_cached_deepgram.
+    """
+    try:
+        _ensure_mixer(pcm=True)
+        sound = pygame.mixer.Sound(buffer=pcm_bytes)
+        sound.play()
+        # Wait exactly for the clip length rather than polling
+        pygame.time.wait(int(sound.get_length() * 1000))
     except pygame.error as e:
         logging.error(f"Failed to play audio: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred while playing audio: {e}")
-    finally:
-        pygame.mixer.quit()
\ No newline at end of file
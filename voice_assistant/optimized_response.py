@@ -1,128 +1,281 @@
 # voice_assistant/optimized_response.py
 
+import hashlib
 import logging
+import re
+import threading
+from collections import OrderedDict
 from voice_assistant.config import Config
-from voice_assistant.property_kb_handler import PropertyKBHandler
+from voice_assistant.property_kb_handler import PropertyKBHandler, QueryIntent
 
 # Initialize property KB handler
 property_kb = PropertyKBHandler()
 
+# Keyword patterns compiled once at import; matched against lowercased text
+_FOLLOWUP_RE = re.compile(
+    r"\b(?:are you the only one|only one|just that|only that|is that all|that's it|"
+    r"nothing else|any others|more options|other properties|different ones|"
+    r"what else|anything else|other locations|other areas)\b"
+)
+_DETAIL_RE = re.compile(r"\b(?:yes|want|details|more|information|tell me|show me|provide)\b")
+_PRONOUN_RE = re.compile(r"\b(?:them|those|that|this|it)\b")
+# Assistant-side indicators keep plain substring semantics (e.g. 'bedroom' in 'bedrooms')
+# and ignore case so history messages are scanned without lowercased copies
+_PROPERTY_INDICATOR_RE = re.compile(r"property|properties|dubai|aed|bedroom|bhk|location", re.IGNORECASE)
+_PROPERTY_MENTION_RE = re.compile(r"property|properties|dubai|aed|bedroom", re.IGNORECASE)
+# Word tokens for cache keys; keeps decimals and apostrophes ("2.5m", "that's") intact
+_CACHE_WORD_RE = re.compile(r"\w+(?:[.']\w+)*")
+# Spoken fillers that transcripts include inconsistently and that never change the answer
+_FILLER_WORDS = frozenset({'um', 'uh', 'uhm', 'erm', 'hmm', 'mm'})
+# Whitespace following sentence-ending punctuation, used to split streamed replies
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Bounded LRU of Groq replies keyed by prompt context; only the LLM path is cached
+_RESPONSE_CACHE_SIZE = 256
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
 def generate_response_with_cached_groq(groq_client, chat_history):
     """
     Optimized response generation using cached Groq client with property KB integration.
     """
     try:
-        # Get the latest user message
-        user_message = ""
-        for message in reversed(chat_history):
-            if message.get('role') == 'user':
-                user_message = message.get('content', '')
-                break
+        user_message, last_assistant, recent_assistant = _scan_history(chat_history)
+        direct_response, added_messages = _prepare_response(user_message, last_assistant, recent_assistant)
+        if direct_response is not None:
+            return direct_response
+        
+        cache_key = _response_cache_key(chat_history, user_message, last_assistant)
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                _response_cache.move_to_end(cache_key)
+                return cached
         
-        # Check if this is a follow-up question about previously mentioned properties
-        is_follow_up_question = _is_follow_up_about_properties(user_message, chat_history)
+        response = _create_completion(groq_client, chat_history, added_messages, stream=False)
+        response_text = response.choices[0].message.content
         
-        # Check if it's a property-related query
-        if property_kb.is_property_related_query(user_message) or is_follow_up_question:
-            # Check if this is a follow-up request for details
-            detail_keywords = ['yes', 'want', 'details', 'more', 'information', 'tell me', 'show me', 'provide']
-            is_detail_request = any(keyword in user_message.lower() for keyword in detail_keywords)
+        with _response_cache_lock:
+            _response_cache[cache_key] = response_text
+            if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+        return response_text
+        
+    except Exception as e:
+        logging.error(f"Optimized Groq response generation error: {e}")
+        raise
+
+def stream_response_with_cached_groq(groq_client, chat_history):
+    """
+    Streaming variant of generate_response_with_cached_groq.
+    
+    Yields the reply one sentence at a time as Groq produces tokens, so speech
+    synthesis can start on the first sentence before the completion finishes.
+    Answers served straight from the property KB are yielded in one piece, and
+    replies already in the response cache are replayed sentence by sentence.
+    """
+    try:
+        user_message, last_assistant, recent_assistant = _scan_history(chat_history)
+        direct_response, added_messages = _prepare_response(user_message, last_assistant, recent_assistant)
+        if direct_response is not None:
+            yield direct_response
+            return
+        
+        cache_key = _response_cache_key(chat_history, user_message, last_assistant)
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                _response_cache.move_to_end(cache_key)
+        if cached is not None:
+            for sentence in _SENTENCE_END_RE.split(cached):
+                if sentence.strip():
+                    yield sentence.strip()
+            return
+        
+        response = _create_completion(groq_client, chat_history, added_messages, stream=True)
+        emitted = []
+        buffer = ""
+        for chunk in response:
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            buffer += delta
+            # Emit every complete sentence and keep the unfinished tail buffered
+            *sentences, buffer = _SENTENCE_END_RE.split(buffer)
+            for sentence in sentences:
+                if sentence.strip():
+                    emitted.append(sentence.strip())
+                    yield sentence.strip()
+        if buffer.strip():
+            emitted.append(buffer.strip())
+            yield buffer.strip()
+        
+        # Cache only completed replies so an interrupted stream is never replayed
+        with _response_cache_lock:
+            _response_cache[cache_key] = " ".join(emitted)
+            if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+        
+    except Exception as e:
+        logging.error(f"Optimized Groq streaming response error: {e}")
+        raise
+
+def _response_cache_key(chat_history, user_message, last_assistant):
+    """
+    Build the response cache key from the system prompt, the normalized latest
+    user message and the latest assistant turn.
+    
+    The user message is reduced to its lowercased words without punctuation or
+    fillers, so transcripts of the same question that differ only in STT
+    formatting ("Price in Dubai Marina?" vs "um, price in dubai marina") share a key.
+    """
+    system_prompt = chat_history[0].get('content', '') if chat_history and chat_history[0].get('role') == 'system' else ''
+    normalized_message = " ".join(
+        word for word in _CACHE_WORD_RE.findall(user_message.lower()) if word not in _FILLER_WORDS
+    )
+    key_source = f"{system_prompt}||{normalized_message}||{last_assistant or ''}"
+    return hashlib.blake2b(key_source.encode(), digest_size=16).digest()
+
+def _scan_history(chat_history):
+    """
+    Walk chat history backwards once, stopping as soon as everything is found.
+    
+    Returns:
+    tuple: (last_user, last_assistant, recent_assistant) - the latest user message,
+    the latest assistant message (None if there is none) and the assistant
+    messages among the last 4 entries, newest first.
+    """
+    last_user = None
+    last_assistant = None
+    recent_assistant = []
+    for index, message in enumerate(reversed(chat_history)):
+        role = message.get('role')
+        if role == 'user':
+            if last_user is None:
+                last_user = message.get('content', '')
+        elif role == 'assistant':
+            content = message.get('content', '')
+            if last_assistant is None:
+                last_assistant = content
+            if index < 4:
+                recent_assistant.append(content)
+        if index >= 3 and last_user is not None and last_assistant is not None:
+            break
+    return last_user or "", last_assistant, recent_assistant
+
+def _create_completion(groq_client, chat_history, added_messages, stream):
+    """
+    Call Groq with the prompt messages temporarily appended to chat history.
+    """
+    # Extend the history in place instead of copying it, and restore it afterwards.
+    # The request body is built inside create(), so this is safe for streaming too.
+    chat_history.extend(added_messages)
+    try:
+        # Generate response with optimized parameters for very concise answers
+        return groq_client.chat.completions.create(
+            model=Config.GROQ_LLM,
+            messages=chat_history,
+            temperature=0.3,  # Very low temperature for focused responses
+            max_tokens=50,    # Very short responses
+            top_p=0.7,        # More focused generation
+            stream=stream
+        )
+    finally:
+        del chat_history[-len(added_messages):]
+
+def _prepare_response(user_message, last_assistant, recent_assistant):
+    """
+    Decide how to answer the latest user message.
+    
+    Takes the (last_user, last_assistant, recent_assistant) tuple from _scan_history.
+    
+    Returns:
+    tuple: (direct_response, added_messages). direct_response is a ready answer from
+    the property KB when no LLM call is needed; otherwise it is None and
+    added_messages holds the prompt messages for the Groq call.
+    """
+    # Normalize once and share it with every KB lookup this turn
+    query = property_kb.prepare_query(user_message)
+    user_message_lower = query.lower
+    intent = property_kb.classify_query(query)
+    
+    # Check if this is a follow-up question about previously mentioned properties
+    is_follow_up_question = _is_follow_up_about_properties(user_message_lower, last_assistant, recent_assistant)
+    
+    # Check if it's a property-related query
+    if QueryIntent.PROPERTY in intent or is_follow_up_question:
+        # Check if this is a follow-up request for details
+        is_detail_request = _DETAIL_RE.search(user_message_lower) is not None
+        
+        # If it's a follow-up question, search for all properties to provide context
+        if is_follow_up_question:
+            matching_properties = property_kb.search_properties("all properties")
+        else:
+            # Search properties based on user query
+            matching_properties = property_kb.search_properties(query)
+        
+        if is_detail_request and matching_properties:
+            # Provide detailed response
+            return property_kb.format_detailed_property_response(matching_properties), None
+        else:
+            # Provide concise response
+            property_response = property_kb.format_property_response(matching_properties)
             
-            # If it's a follow-up question, search for all properties to provide context
-            if is_follow_up_question:
-                matching_properties = property_kb.search_properties("all properties")
-            else:
-                # Search properties based on user query
-                matching_properties = property_kb.search_properties(user_message)
+            # Create enhanced response with property info
+            enhanced_prompt = f"""
+            User: {user_message}
+            Property data: {property_response}
             
-            if is_detail_request and matching_properties:
-                # Provide detailed response
-                return property_kb.format_detailed_property_response(matching_properties)
-            else:
-                # Provide concise response
-                property_response = property_kb.format_property_response(matching_properties)
-                
-                # Create enhanced response with property info
-                enhanced_prompt = f"""
-                User: {user_message}
-                Property data: {property_response}
-                
-                Provide a very short response. Maximum 25 words. Key facts only.
-                """
-                
-                # Add the enhanced prompt to chat history
-                enhanced_chat_history = chat_history.copy()
-                enhanced_chat_history.append({
+            Provide a very short response. Maximum 25 words. Key facts only.
+            """
+            
+            # Messages appended to chat history for this call only
+            added_messages = [
+                {
                     "role": "system", 
                     "content": "You are a UAE property assistant. Provide very short, direct responses. Maximum 25 words. Use key facts only."
-                })
-                enhanced_chat_history.append({
+                },
+                {
                     "role": "user", 
                     "content": enhanced_prompt
-                })
-            
-        elif property_kb.is_greeting_or_general_query(user_message):
-            # Handle greetings and general queries
-            enhanced_chat_history = chat_history.copy()
-            enhanced_chat_history.append({
+                }
+            ]
+        
+    elif QueryIntent.GENERAL in intent:
+        # Handle greetings and general queries
+        added_messages = [
+            {
                 "role": "system", 
                 "content": "You are a UAE property assistant. Provide very short responses. Maximum 20 words for greetings. For emotional responses like 'that\'s nice', respond naturally and professionally."
-            })
-            
-        else:
-            # Non-property query - provide default response
-            return property_kb.get_default_response()
-        
-        # Generate response with optimized parameters for very concise answers
-        response = groq_client.chat.completions.create(
-            model=Config.GROQ_LLM,
-            messages=enhanced_chat_history,
-            temperature=0.3,  # Very low temperature for focused responses
-            max_tokens=50,    # Very short responses
-            top_p=0.7,        # More focused generation
-            stream=False      # Disable streaming for faster response
-        )
-        return response.choices[0].message.content
+            }
+        ]
         
-    except Exception as e:
-        logging.error(f"Optimized Groq response generation error: {e}")
-        raise
+    else:
+        # Non-property query - provide default response
+        return property_kb.get_default_response(), None
+    
+    return None, added_messages
+    
 
-def _is_follow_up_about_properties(user_message: str, chat_history: list) -> bool:
+def _is_follow_up_about_properties(user_message_lower: str, last_assistant, recent_assistant: list) -> bool:
     """
     Check if the user message is a follow-up question about previously mentioned properties.
-    """
-    user_message_lower = user_message.lower()
     
-    # Keywords that indicate follow-up questions about properties
-    follow_up_keywords = [
-        'are you the only one', 'only one', 'just that', 'only that',
-        'is that all', 'that\'s it', 'nothing else', 'any others',
-        'more options', 'other properties', 'different ones',
-        'what else', 'anything else', 'other locations', 'other areas'
-    ]
-    
-    # Check if the message contains follow-up keywords
-    if any(keyword in user_message_lower for keyword in follow_up_keywords):
-        # Check if the previous assistant message mentioned properties
-        for message in reversed(chat_history):
-            if message.get('role') == 'assistant':
-                assistant_message = message.get('content', '').lower()
-                # Check if the assistant message contains property-related terms
-                property_indicators = ['property', 'properties', 'dubai', 'aed', 'bedroom', 'bhk', 'location']
-                if any(indicator in assistant_message for indicator in property_indicators):
-                    return True
-                break
+    Args:
+    user_message_lower (str): The latest user message, lowercased.
+    last_assistant (str): The latest assistant message, or None.
+    recent_assistant (list): Assistant messages among the last 4 history entries.
+    """
+    # Check if the message contains follow-up keywords and the previous
+    # assistant message mentioned properties
+    if _FOLLOWUP_RE.search(user_message_lower):
+        if last_assistant and _PROPERTY_INDICATOR_RE.search(last_assistant):
+            return True
     
-    # Check for pronouns that refer to properties
-    pronoun_keywords = ['them', 'those', 'that', 'this', 'it']
-    if any(pronoun in user_message_lower for pronoun in pronoun_keywords):
-        # Check recent context for property mentions
-        recent_messages = chat_history[-4:]  # Check last 4 messages
-        for message in recent_messages:
-            if message.get('role') == 'assistant':
-                assistant_message = message.get('content', '').lower()
-                if any(term in assistant_message for term in ['property', 'properties', 'dubai', 'aed', 'bedroom']):
-                    return True
+    # Check for pronouns that refer to properties in recent context
+    if _PRONOUN_RE.search(user_message_lower):
+        # One scan over the joined messages; no indicator spans a newline
+        if _PROPERTY_MENTION_RE.search("\n".join(recent_assistant)):
+            return True
     
-    return False 
\ No newline at end of file
+    return False
@@ -1,18 +1,27 @@
 # voice_assistant/optimized_transcription.py
 
-import json
 import logging
-from deepgram import PrerecordedOptions
+import threading
 
-def transcribe_with_cached_deepgram(deepgram_client, audio_file_path):
+# Longest wait for Deepgram's last transcripts after a live stream is finalized
+LIVE_FINALIZE_TIMEOUT = 2.0
+
+def transcribe_with_cached_deepgram(deepgram_client, audio_file_path=None, audio_bytes=None):
     """
     Optimized transcription using cached Deepgram client for faster response.
+    
+    Pass audio_bytes to transcribe audio already in memory (e.g. an upload)
+    without a disk round-trip; otherwise audio_file_path is read.
     """
     try:
-        with open(audio_file_path, "rb") as file:
-            buffer_data = file.read()
+        # Imported here so importing this module does not load the Deepgram SDK
+        from deepgram import PrerecordedOptions
+        
+        if audio_bytes is None:
+            with open(audio_file_path, "rb") as file:
+                audio_bytes = file.read()
 
-        payload = {"buffer": buffer_data}
+        payload = {"buffer": audio_bytes}
         # Use faster model for better latency
         options = PrerecordedOptions(
             model="nova-2", 
@@ -25,10 +34,82 @@ def transcribe_with_cached_deepgram(deepgram_client, audio_file_path):
         )
         
         response = deepgram_client.listen.prerecorded.v("1").transcribe_file(payload, options)
-        data = json.loads(response.to_json())
-
-        transcript = data['results']['channels'][0]['alternatives'][0]['transcript']
+        # Read the transcript straight off the SDK response object
+        transcript = response.results.channels[0].alternatives[0].transcript
         return transcript
     except Exception as e:
         logging.error(f"Optimized Deepgram transcription error: {e}")
-        raise 
\ No newline at end of file
+        raise
+
+
+def open_live_transcription_with_cached_deepgram(deepgram_client, on_utterance, sample_rate=16000):
+    """
+    Open a streaming (WebSocket) transcription on the cached Deepgram client.
+    
+    Audio is transcribed while it is still arriving, so an utterance's text is
+    ready moments after the speaker stops instead of after a full upload.
+    
+    Args:
+    deepgram_client: The cached DeepgramClient.
+    on_utterance (callable): Called with the text of each finished utterance, on the SDK's listener thread.
+    sample_rate (int): Sample rate of the 16-bit mono PCM frames that will be sent.
+    
+    Returns:
+    tuple: (connection, close). Feed the connection with send(pcm_bytes); call close()
+    when the audio ends; it waits for the last transcripts and delivers any unfinished utterance.
+    """
+    try:
+        from deepgram import LiveOptions, LiveTranscriptionEvents
+        
+        connection = deepgram_client.listen.live.v("1")
+        segments = []
+        finalized = threading.Event()
+        
+        def flush():
+            if segments:
+                text = " ".join(segments)
+                segments.clear()
+                on_utterance(text)
+        
+        def on_transcript(_connection, result, **kwargs):
+            transcript = result.channel.alternatives[0].transcript
+            if result.is_final and transcript:
+                segments.append(transcript)
+            # speech_final marks the endpoint Deepgram detected after the speaker paused
+            if result.speech_final:
+                flush()
+            # Result of the Finalize request sent by close(); nothing more is pending
+            if getattr(result, 'from_finalize', False):
+                finalized.set()
+        
+        def close():
+            # finish() signals Close before Deepgram has returned the final transcripts,
+            # so first ask it to transcribe the buffered audio and wait for that result
+            try:
+                if connection.finalize():
+                    finalized.wait(LIVE_FINALIZE_TIMEOUT)
+            except Exception as e:
+                logging.warning(f"Could not finalize Deepgram live transcription: {e}")
+            finally:
+                connection.finish()
+                # The listener thread has stopped; hand over what was said mid-sentence
+                flush()
+        
+        connection.on(LiveTranscriptionEvents.Transcript, on_transcript)
+        
+        options = LiveOptions(
+            model="nova-2",
+            smart_format=True,
+            language="en-US",
+            punctuate=True,
+            encoding="linear16",
+            sample_rate=sample_rate,
+            channels=1,
+            endpointing=300  # ms of silence that ends an utterance
+        )
+        if not connection.start(options):
+            raise RuntimeError("Deepgram live connection failed to start")
+        return connection, close
+    except Exception as e:
+        logging.error(f"Deepgram live transcription error: {e}")
+        raise
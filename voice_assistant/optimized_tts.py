@@ -1,24 +1,144 @@
 # voice_assistant/optimized_tts.py
 
+import asyncio
 import logging
-from deepgram import SpeakOptions
 
-def tts_with_cached_deepgram(deepgram_client, text, output_file_path):
+# Deepgram voice used for all optimized TTS; also part of TTS cache keys
+DEEPGRAM_TTS_MODEL = "aura-arcas-en"  # Fastest model
+
+def tts_bytes_with_cached_deepgram(deepgram_client, text):
     """
-    Optimized TTS using cached Deepgram client for faster response.
+    Optimized TTS returning the WAV audio in memory instead of writing a file.
+    
+    Args:
+    deepgram_client: The cached Deepgram client.
+    text (str): The text to synthesize.
+    
+    Returns:
+    bytes: The synthesized 16 kHz linear16 WAV audio.
     """
     try:
-        # Use faster model and optimized parameters
+        # Imported here so importing this module does not load the Deepgram SDK
+        from deepgram import SpeakOptions
+        
         options = SpeakOptions(
-            model="aura-arcas-en",  # Fastest model
+            model=DEEPGRAM_TTS_MODEL,
             encoding="linear16",
             container="wav",
             sample_rate=16000  # Supported sample rate for speed
         )
         
-        SPEAK_OPTIONS = {"text": text}
-        response = deepgram_client.speak.v("1").save(output_file_path, SPEAK_OPTIONS, options)
-        return True
+        response = deepgram_client.speak.v("1").stream({"text": text}, options)
+        return response.stream.getvalue()
     except Exception as e:
         logging.error(f"Optimized Deepgram TTS error: {e}")
-        raise 
\ No newline at end of file
+        raise
+
+def tts_stream_with_cached_deepgram(deepgram_client, text, chunk_size=16384):
+    """
+    Optimized TTS yielding the WAV audio in chunks as Deepgram synthesizes it.
+    
+    The request is made before returning, so API errors are raised to the caller
+    rather than in the middle of a streamed response.
+    
+    Args:
+    deepgram_client: The cached Deepgram client.
+    text (str): The text to synthesize.
+    chunk_size (int): Size in bytes of the yielded chunks.
+    
+    Returns:
+    iterator: The 16 kHz linear16 WAV audio as bytes chunks.
+    """
+    try:
+        from deepgram import SpeakOptions
+        
+        options = SpeakOptions(
+            model=DEEPGRAM_TTS_MODEL,
+            encoding="linear16",
+            container="wav",
+            sample_rate=16000  # Supported sample rate for speed
+        )
+        
+        response = deepgram_client.speak.v("1").stream_raw({"text": text}, options)
+    except Exception as e:
+        logging.error(f"Optimized Deepgram streaming TTS error: {e}")
+        raise
+    
+    def chunks():
+        try:
+            yield from response.iter_bytes(chunk_size)
+        finally:
+            response.close()
+    
+    return chunks()
+
+def tts_pcm_with_cached_deepgram(deepgram_client, text, debug_output_path=None):
+    """
+    Optimized TTS returning raw PCM bytes instead of writing a WAV file.
+    
+    The audio is 16 kHz mono linear16 with no container, matching the format
+    the cached pygame mixer is opened with, so it can be played straight from
+    memory via audio.play_pcm.
+    
+    Args:
+    deepgram_client: The cached Deepgram client.
+    text (str): The text to synthesize.
+    debug_output_path (str): If set, also write the PCM bytes to this path for debugging.
+    
+    Returns:
+    bytes: The synthesized PCM audio.
+    """
+    try:
+        from deepgram import SpeakOptions
+        
+        options = SpeakOptions(
+            model=DEEPGRAM_TTS_MODEL,
+            encoding="linear16",
+            container="none",  # Raw PCM, no WAV header
+            sample_rate=16000
+        )
+        
+        response = deepgram_client.speak.v("1").stream({"text": text}, options)
+        pcm_bytes = response.stream.getvalue()
+        
+        if debug_output_path:
+            with open(debug_output_path, "wb") as debug_file:
+                debug_file.write(pcm_bytes)
+            logging.debug(f"Deepgram PCM written to {debug_output_path}")
+        return pcm_bytes
+    except Exception as e:
+        logging.error(f"Optimized Deepgram PCM TTS error: {e}")
+        raise
+
+async def tts_sentences_with_cached_deepgram(deepgram_client, sentences):
+    """
+    Synthesize sentences while they are still being produced, e.g. by
+    stream_response_with_cached_groq, instead of waiting for the full reply.
+    
+    Args:
+    deepgram_client: The cached Deepgram client.
+    sentences (iterable): Blocking iterable of sentences; consumed on a worker thread.
+    
+    Yields:
+    bytes: The WAV audio of each sentence, in sentence order.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    
+    def produce():
+        try:
+            for sentence in sentences:
+                loop.call_soon_threadsafe(queue.put_nowait, sentence)
+        finally:
+            # Sentinel marks the end of the stream, even on error
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+    
+    producer = loop.run_in_executor(None, produce)
+    while True:
+        sentence = await queue.get()
+        if sentence is None:
+            break
+        yield await asyncio.to_thread(tts_bytes_with_cached_deepgram, deepgram_client, sentence)
+    
+    # Surface any error raised by the producer
+    await producer
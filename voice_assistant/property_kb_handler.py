@@ -1,9 +1,117 @@
 # voice_assistant/property_kb_handler.py
 
-import json
 import logging
 import re
-from typing import List, Dict, Optional, Set
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import IntFlag
+from typing import List, Dict, FrozenSet, Optional, Set, Tuple, Union
+import orjson
+
+# Patterns compiled once at import for the per-query search and formatting paths
+_BR_RE = re.compile(r'(\d+)br')
+_BEDROOM_RE = re.compile(r'(\d+)\s*bedroom')
+_PRICE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:million|m|k|thousand)?\s*(?:aed|dollars?|dirhams?)')
+_BUDGET_RE = re.compile(r'(\d+)\s*(?:million|m|k|thousand)?\s*(?:budget|around|upto|max)')
+_PRICE_VAL_RE = re.compile(r'(\d+\.?\d*)M')
+
+# Number of normalized queries whose search results are kept per handler
+_SEARCH_CACHE_SIZE = 256
+# Number of normalized queries whose intent classification is kept per handler
+_INTENT_CACHE_SIZE = 512
+
+# Queries that list every property
+_ALL_QUERIES = frozenset({'all properties', 'all property', 'all', 'everything', 'show all'})
+
+# Common location abbreviations added as keywords when they occur in a location name
+_LOC_ABBREVS = (
+    'dubai', 'palm', 'jumeirah', 'hills', 'ranches', 'estate', 'jebel',
+    'ali', 'beach', 'marina', 'downtown', 'emirates', 'arabian'
+)
+
+# Follow-up requests for details
+_DETAIL_KEYWORDS = frozenset({'yes', 'want', 'details', 'more', 'information', 'tell me', 'show me', 'provide'})
+
+# Follow-up questions about properties
+_FOLLOW_UP_KEYWORDS = frozenset({
+    'are you the only one', 'only one', 'just that', 'only that',
+    'is that all', 'that\'s it', 'nothing else', 'any others',
+    'more options', 'other properties', 'different ones',
+    'what else', 'anything else', 'other locations', 'other areas',
+    'them', 'those', 'that', 'this', 'it'
+})
+
+# Greeting and general keywords
+_GENERAL_KEYWORDS = frozenset({
+    'hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening',
+    'how are you', 'what is your name', 'who are you', 'tell me about yourself',
+    'what can you do', 'help', 'pricing', 'accounting', 'services',
+    'thank you', 'thanks', 'bye', 'goodbye', 'see you'
+})
+
+# Emotional and acknowledgment responses
+_EMOTIONAL_KEYWORDS = frozenset({
+    'nice', 'good', 'great', 'excellent', 'perfect', 'awesome', 'amazing',
+    'wow', 'cool', 'fantastic', 'wonderful', 'lovely', 'beautiful',
+    'that\'s nice', 'that\'s good', 'that\'s great', 'sounds good',
+    'okay', 'ok', 'alright', 'fine', 'sure', 'yes', 'yeah', 'yep',
+    'interesting', 'impressive', 'not bad', 'pretty good'
+})
+
+# Single-word greeting/general keywords for a token-intersection fast path
+_GENERAL_KW_SINGLE = frozenset(keyword for keyword in _GENERAL_KEYWORDS | _EMOTIONAL_KEYWORDS if ' ' not in keyword)
+
+def _build_char_trie(keywords) -> Dict:
+    """Build a nested-dict character trie; the '' key marks the end of a keyword"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return trie
+
+def _trie_to_pattern(node: Dict) -> str:
+    """
+    Render a trie node as a regex with shared prefixes factored out.
+    
+    Children are tried before ending at the node, so the longest keyword wins.
+    """
+    branches = [re.escape(char) + _trie_to_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if '' in node:
+        # Keyword may stop here; wrap so the optional applies to the whole remainder
+        return f"(?:{pattern})?"
+    return pattern
+
+def _compile_keywords(keywords, overlapping=False) -> re.Pattern:
+    """
+    Compile keywords into a single pattern that matches any of them as a substring.
+    
+    Keywords are merged into a character trie so the regex engine walks shared
+    prefixes once and always reports the longest keyword. With overlapping=True the
+    pattern is wrapped in a lookahead so finditer reports a match at every position.
+    """
+    if not keywords:
+        return re.compile(r'(?!)')  # Never matches
+    pattern = _trie_to_pattern(_build_char_trie(keywords))
+    return re.compile(f'(?=({pattern}))' if overlapping else pattern)
+
+@dataclass(frozen=True, slots=True)
+class QueryCtx:
+    """A user query normalized once per turn and shared by the KB lookups"""
+    lower: str
+    tokens: FrozenSet[str]
+    has_digits: bool
+
+class QueryIntent(IntFlag):
+    """Bitmask of the intents a query matched"""
+    NONE = 0
+    PROPERTY = 1
+    GENERAL = 2
 
 class PropertyKBHandler:
     def __init__(self, kb_file_path: str = "KB/uae_property_kb.json"):
@@ -11,18 +119,50 @@ class PropertyKBHandler:
         self.properties = self._load_properties()
         # Dynamic data extraction
         self.locations = self._extract_locations()
+        # Location names for suggestions never change, so format them once
+        self._location_list_str = ", ".join(loc.title() for loc in sorted(self.locations))
         self.features = self._extract_features()
         self.location_keywords = self._build_location_keywords()
         self.property_keywords = self._build_property_keywords()
+        # Single-pass keyword matchers built once from the keyword sets
+        all_property_keywords = self.property_keywords + list(_DETAIL_KEYWORDS | _FOLLOW_UP_KEYWORDS)
+        self._property_re = _compile_keywords(all_property_keywords)
+        # Single-word keywords for a token-intersection fast path
+        self._single_word_kw = frozenset(keyword for keyword in all_property_keywords if ' ' not in keyword)
+        self._general_re = _compile_keywords(_GENERAL_KEYWORDS | _EMOTIONAL_KEYWORDS)
+        self._keyword_to_locations = self._build_keyword_to_locations()
+        self._location_keyword_re = _compile_keywords(self._keyword_to_locations, overlapping=True)
+        self._property_indexes_by_location = self._build_property_indexes_by_location()
+        # LRU of search results keyed by normalized query
+        self._search_cache = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        # LRU of intent bitmasks keyed by normalized query
+        self._intent_cache = OrderedDict()
+        self._intent_cache_lock = threading.Lock()
         
     def _load_properties(self) -> List[Dict]:
-        """Load properties from the KB file"""
+        """Load properties from the KB file and precompute derived search fields"""
         try:
-            with open(self.kb_file_path, 'r', encoding='utf-8') as file:
-                return json.load(file)
+            # orjson parses bytes directly, so read the file in binary mode
+            with open(self.kb_file_path, 'rb') as file:
+                properties = orjson.loads(file.read())
         except Exception as e:
             logging.error(f"Error loading property KB: {e}")
             return []
+        
+        for prop in properties:
+            price = prop.get('price', '')
+            # Price in millions for budget filtering; listings without one never match
+            price_match = _PRICE_VAL_RE.search(price)
+            prop['_price_m'] = float(price_match.group(1)) if price_match else float('inf')
+            prop['_price_lower'] = price.lower()
+            # Lowercased fields and dedup key used on every query
+            prop['_location_lc'] = prop.get('location', '').lower()
+            prop['_features_lc'] = prop.get('features', '').lower()
+            prop['_key'] = f"{prop.get('location')}_{price}_{prop.get('features')}"
+            # Features never change, so resolve the bhk label once for the formatters
+            prop['_bhk'] = self._extract_bhk_from_features(prop.get('features', ''))
+        return properties
     
     def _extract_locations(self) -> Set[str]:
         """Dynamically extract all unique locations from KB data"""
@@ -53,45 +193,34 @@ class PropertyKBHandler:
             if not location:
                 continue
                 
-            # Generate keywords from location name
-            keywords = [location]
+            # Keywords: the full name, its words and any common abbreviations it contains
+            keywords = {location, *location.split(), *(abbrev for abbrev in _LOC_ABBREVS if abbrev in location)}
             
-            # Split location name into words
-            words = location.split()
-            keywords.extend(words)
-            
-            # Add common abbreviations
-            if 'dubai' in location:
-                keywords.append('dubai')
-            if 'palm' in location:
-                keywords.append('palm')
-            if 'jumeirah' in location:
-                keywords.append('jumeirah')
-            if 'hills' in location:
-                keywords.append('hills')
-            if 'ranches' in location:
-                keywords.append('ranches')
-            if 'estate' in location:
-                keywords.append('estate')
-            if 'jebel' in location:
-                keywords.append('jebel')
-            if 'ali' in location:
-                keywords.append('ali')
-            if 'beach' in location:
-                keywords.append('beach')
-            if 'marina' in location:
-                keywords.append('marina')
-            if 'downtown' in location:
-                keywords.append('downtown')
-            if 'emirates' in location:
-                keywords.append('emirates')
-            if 'arabian' in location:
-                keywords.append('arabian')
-            
-            location_keywords[location] = list(set(keywords))
+            location_keywords[location] = list(keywords)
         
         return location_keywords
     
+    def _build_keyword_to_locations(self) -> Dict[str, Set[str]]:
+        """Invert location keywords into keyword -> locations"""
+        keyword_to_locations = {}
+        for location, keywords in self.location_keywords.items():
+            for keyword in keywords:
+                keyword_to_locations.setdefault(keyword, set()).add(location)
+        
+        # A keyword match implies a match of every keyword it contains, which keeps
+        # results exact when the location matcher reports only the longest keyword
+        return {
+            keyword: set().union(*(locations for other, locations in keyword_to_locations.items() if other in keyword))
+            for keyword in keyword_to_locations
+        }
+    
+    def _build_property_indexes_by_location(self) -> Dict[str, List[int]]:
+        """Index property positions by lowercased location"""
+        indexes_by_location = {}
+        for index, prop in enumerate(self.properties):
+            indexes_by_location.setdefault(prop['_location_lc'], []).append(index)
+        return indexes_by_location
+    
     def _build_property_keywords(self) -> List[str]:
         """Dynamically build property keywords from actual data"""
         keywords = set()
@@ -119,20 +248,19 @@ class PropertyKBHandler:
         
         return list(keywords)
     
-    def _extract_bhk_from_features(self, features: str) -> str:
+    @staticmethod
+    def _extract_bhk_from_features(features: str) -> str:
         """Dynamically extract BHK information from features"""
         features_lower = features.lower()
         
         # Look for BR patterns
-        br_pattern = r'(\d+)BR'
-        br_match = re.search(br_pattern, features_lower)
+        br_match = _BR_RE.search(features_lower)
         if br_match:
             number = br_match.group(1)
             return f"{number} bhk"
         
         # Look for bedroom patterns
-        bedroom_pattern = r'(\d+)\s*bedroom'
-        bedroom_match = re.search(bedroom_pattern, features_lower)
+        bedroom_match = _BEDROOM_RE.search(features_lower)
         if bedroom_match:
             number = bedroom_match.group(1)
             return f"{number} bhk"
@@ -140,69 +268,85 @@ class PropertyKBHandler:
         # Default fallback
         return "apartment"
     
-    def search_properties(self, query: str) -> List[Dict]:
-        """Search properties based on user query using dynamic keywords"""
-        query_lower = query.lower()
-        matching_properties = []
+    def prepare_query(self, query: str) -> QueryCtx:
+        """Normalize a user query once so every lookup in a turn can share it"""
+        query_lower = query.lower().strip()
+        return QueryCtx(
+            lower=query_lower,
+            tokens=frozenset(query_lower.split()),
+            has_digits=any(char.isdigit() for char in query_lower)
+        )
+    
+    def _as_query_ctx(self, query: Union[str, QueryCtx]) -> QueryCtx:
+        """Accept either a raw query string or an already prepared QueryCtx"""
+        return query if isinstance(query, QueryCtx) else self.prepare_query(query)
+    
+    def search_properties(self, query: Union[str, QueryCtx]) -> Tuple[Dict, ...]:
+        """Search properties based on user query using dynamic keywords, caching results per query"""
+        ctx = self._as_query_ctx(query)
+        with self._search_cache_lock:
+            cached = self._search_cache.get(ctx.lower)
+            if cached is not None:
+                self._search_cache.move_to_end(ctx.lower)
+                return cached
         
+        # Tuples keep cached results safe from callers mutating them
+        results = tuple(self._search_properties_uncached(ctx))
+        with self._search_cache_lock:
+            self._search_cache[ctx.lower] = results
+            if len(self._search_cache) > _SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return results
+    
+    def _search_properties_uncached(self, ctx: QueryCtx) -> List[Dict]:
+        """Run the full property search for a normalized query"""
+        query_lower = ctx.lower
         # Handle "all properties" queries
-        if query_lower in ['all properties', 'all property', 'all', 'everything', 'show all']:
+        if query_lower in _ALL_QUERIES:
             return self.properties
         
-        # Search by location using dynamic keywords
-        for property_data in self.properties:
-            location = property_data.get('location', '').lower()
-            
-            # Check if query matches location keywords
-            if location in self.location_keywords:
-                keywords = self.location_keywords[location]
-                if any(keyword in query_lower for keyword in keywords):
-                    matching_properties.append(property_data)
-            
-            # Also check direct location match
-            if location in query_lower:
-                matching_properties.append(property_data)
+        # Search by location using dynamic keywords, scanning the query once
+        matched_locations = set()
+        for match in self._location_keyword_re.finditer(query_lower):
+            matched_locations.update(self._keyword_to_locations[match.group(1)])
         
-        # Remove duplicates
-        seen = set()
-        unique_properties = []
-        for prop in matching_properties:
-            prop_key = f"{prop['location']}_{prop['price']}_{prop['features']}"
-            if prop_key not in seen:
-                seen.add(prop_key)
-                unique_properties.append(prop)
+        # Emit matches through the location index in KB order, dropping duplicate listings
+        matched_indexes = sorted(
+            index
+            for location in matched_locations
+            for index in self._property_indexes_by_location.get(location, ())
+        )
+        results: Dict[str, Dict] = {}
+        for index in matched_indexes:
+            prop = self.properties[index]
+            results.setdefault(prop['_key'], prop)
+        unique_properties = list(results.values())
         
         # Search by features if no location matches
         if not unique_properties:
             for property_data in self.properties:
-                features = property_data.get('features', '').lower()
-                if any(keyword in features for keyword in query_lower.split()):
+                features = property_data['_features_lc']
+                if any(keyword in features for keyword in ctx.tokens):
                     unique_properties.append(property_data)
         
+        # Price and budget patterns need a number, so skip them for text-only queries
+        if not ctx.has_digits:
+            return unique_properties
+        
         # Search by price range if no other matches
         if not unique_properties:
-            price_pattern = r'(\d+(?:\.\d+)?)\s*(?:million|m|k|thousand)?\s*(?:aed|dollars?|dirhams?)'
-            price_matches = re.findall(price_pattern, query_lower)
+            price_matches = _PRICE_RE.findall(query_lower)
             if price_matches:
                 for property_data in self.properties:
-                    property_price = property_data.get('price', '')
-                    if any(price in property_price.lower() for price in price_matches):
+                    if any(price in property_data['_price_lower'] for price in price_matches):
                         unique_properties.append(property_data)
         
         # Search by budget range
         if not unique_properties:
-            budget_pattern = r'(\d+)\s*(?:million|m|k|thousand)?\s*(?:budget|around|upto|max)'
-            budget_matches = re.findall(budget_pattern, query_lower)
+            budget_matches = _BUDGET_RE.findall(query_lower)
             if budget_matches:
                 budget_limit = float(budget_matches[0])
-                for property_data in self.properties:
-                    property_price = property_data.get('price', '')
-                    # Extract price value
-                    price_match = re.search(r'(\d+\.?\d*)M', property_price)
-                    if price_match:
-                        property_price_value = float(price_match.group(1))
-                        if property_price_value <= budget_limit:
-                            unique_properties.append(property_data)
+                unique_properties = [p for p in self.properties if p['_price_m'] <= budget_limit]
         
         return unique_properties
     
@@ -210,100 +354,83 @@ class PropertyKBHandler:
         """Format property information into a professional, concise response"""
         if not properties:
             # Dynamic suggestion based on available locations
-            location_list = ", ".join([loc.title() for loc in sorted(self.locations)])
-            return f"No properties found. Try: {location_list}."
+            return f"No properties found. Try: {self._location_list_str}."
         
         if len(properties) == 1:
             prop = properties[0]
-            bhk = self._extract_bhk_from_features(prop['features'])
-            return f"{prop['location']} {bhk} {prop['price']}"
+            return f"{prop['location']} {prop['_bhk']} {prop['price']}"
         else:
-            # Professional format for multiple properties
-            response = f"Available properties: "
-            for i, prop in enumerate(properties, 1):
-                bhk = self._extract_bhk_from_features(prop['features'])
-                response += f"{i}. {prop['location']} {bhk} {prop['price']}. "
-            return response.strip()
+            # Professional format for multiple properties, joined once
+            parts = [
+                f"{i}. {prop['location']} {prop['_bhk']} {prop['price']}."
+                for i, prop in enumerate(properties, 1)
+            ]
+            return "Available properties: " + " ".join(parts)
     
-    def is_property_related_query(self, query: str) -> bool:
-        """Check if the query is property-related using dynamic keywords"""
-        query_lower = query.lower()
+    def classify_query(self, query: Union[str, QueryCtx]) -> QueryIntent:
+        """Classify a query once into an intent bitmask, caching it per normalized query"""
+        ctx = self._as_query_ctx(query)
+        with self._intent_cache_lock:
+            cached = self._intent_cache.get(ctx.lower)
+            if cached is not None:
+                self._intent_cache.move_to_end(ctx.lower)
+                return cached
         
-        # Check if query contains property-related keywords
-        if any(keyword in query_lower for keyword in self.property_keywords):
-            return True
-        
-        # Check for follow-up requests for details
-        detail_keywords = ['yes', 'want', 'details', 'more', 'information', 'tell me', 'show me', 'provide']
-        if any(keyword in query_lower for keyword in detail_keywords):
-            return True
-        
-        # Check for follow-up questions about properties
-        follow_up_keywords = [
-            'are you the only one', 'only one', 'just that', 'only that',
-            'is that all', 'that\'s it', 'nothing else', 'any others',
-            'more options', 'other properties', 'different ones',
-            'what else', 'anything else', 'other locations', 'other areas',
-            'them', 'those', 'that', 'this', 'it'
-        ]
-        if any(keyword in query_lower for keyword in follow_up_keywords):
-            return True
-        
-        return False
+        intent = QueryIntent.NONE
+        if self._matches_property_keywords(ctx):
+            intent |= QueryIntent.PROPERTY
+        if self._matches_general_keywords(ctx):
+            intent |= QueryIntent.GENERAL
+        with self._intent_cache_lock:
+            self._intent_cache[ctx.lower] = intent
+            if len(self._intent_cache) > _INTENT_CACHE_SIZE:
+                self._intent_cache.popitem(last=False)
+        return intent
+    
+    def is_property_related_query(self, query: Union[str, QueryCtx]) -> bool:
+        """Check if the query is property-related using dynamic keywords"""
+        return QueryIntent.PROPERTY in self.classify_query(query)
     
-    def is_greeting_or_general_query(self, query: str) -> bool:
+    def is_greeting_or_general_query(self, query: Union[str, QueryCtx]) -> bool:
         """Check if the query is a greeting or general question"""
-        query_lower = query.lower()
-        
-        # Greeting and general keywords
-        general_keywords = [
-            'hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening',
-            'how are you', 'what is your name', 'who are you', 'tell me about yourself',
-            'what can you do', 'help', 'pricing', 'accounting', 'services',
-            'thank you', 'thanks', 'bye', 'goodbye', 'see you'
-        ]
+        return QueryIntent.GENERAL in self.classify_query(query)
+    
+    def _matches_property_keywords(self, ctx: QueryCtx) -> bool:
+        """Check the query against the property keywords"""
+        # Fast path: a whole word of the query is itself a keyword
+        if not self._single_word_kw.isdisjoint(ctx.tokens):
+            return True
         
-        # Emotional and acknowledgment responses
-        emotional_keywords = [
-            'nice', 'good', 'great', 'excellent', 'perfect', 'awesome', 'amazing',
-            'wow', 'cool', 'fantastic', 'wonderful', 'lovely', 'beautiful',
-            'that\'s nice', 'that\'s good', 'that\'s great', 'sounds good',
-            'okay', 'ok', 'alright', 'fine', 'sure', 'yes', 'yeah', 'yep',
-            'interesting', 'impressive', 'not bad', 'pretty good'
-        ]
+        # Property keywords, follow-up requests for details and follow-up questions as substrings
+        return self._property_re.search(ctx.lower) is not None
+    
+    def _matches_general_keywords(self, ctx: QueryCtx) -> bool:
+        """Check the query against the greeting and general keywords"""
+        # Fast path: a whole word of the query is itself a keyword
+        if not _GENERAL_KW_SINGLE.isdisjoint(ctx.tokens):
+            return True
         
-        return any(keyword in query_lower for keyword in general_keywords + emotional_keywords)
+        # Greeting, general, emotional and acknowledgment keywords as substrings
+        return self._general_re.search(ctx.lower) is not None
     
     def get_default_response(self) -> str:
         """Get default response for non-property queries using dynamic locations"""
-        location_list = ", ".join([loc.title() for loc in sorted(self.locations)])
-        return f"I'm a UAE property assistant. Ask about {location_list}."
+        return f"I'm a UAE property assistant. Ask about {self._location_list_str}."
     
     def format_detailed_property_response(self, properties: List[Dict]) -> str:
         """Format detailed property information in 3-4 lines"""
         if not properties:
             # Dynamic suggestion based on available locations
-            location_list = ", ".join([loc.title() for loc in sorted(self.locations)])
-            return f"No properties found. Try: {location_list}."
+            return f"No properties found. Try: {self._location_list_str}."
         
         if len(properties) == 1:
             prop = properties[0]
-            bhk = self._extract_bhk_from_features(prop['features'])
-            
             # Format detailed response - point to point, professional
-            response = f"{prop['location']} {bhk} {prop['price']}. "
-            response += f"Features: {prop['features']}. "
-            response += f"Status: {prop['status']}."
-            
-            return response
+            return f"{prop['location']} {prop['_bhk']} {prop['price']}. Features: {prop['features']}. Status: {prop['status']}."
         else:
-            # For multiple properties, provide a clean, professional format
-            response = f"Property details: "
-            
-            for i, prop in enumerate(properties, 1):
-                bhk = self._extract_bhk_from_features(prop['features'])
-                
-                # Clean, professional format - point to point
-                response += f"{i}. {prop['location']} {bhk} {prop['price']} - {prop['features']}. "
-            
-            return response.strip() 
\ No newline at end of file
+            # For multiple properties, provide a clean, professional format - point to point
+            parts = [
+                f"{i}. {prop['location']} {prop['_bhk']} {prop['price']} - {prop['features']}."
+                for i, prop in enumerate(properties, 1)
+            ]
+            return "Property details: " + " ".join(parts) 
\ No newline at end of file
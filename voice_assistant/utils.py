@@ -3,34 +3,108 @@
 import os
 import logging
 import time
+import threading
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before each delete attempt; only used again while the file is locked
+_DELETE_RETRY_DELAYS = (0, 0.05, 0.2, 1.0)
+
+# Small pool so temp-file cleanup (and its retry backoff) never blocks a response
+_delete_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="delete_file")
 
 def delete_file(file_path):
     """
     Delete a file from the filesystem.
-    
+
+    Retries with increasing delays only when the file is locked (PermissionError).
+
     Args:
     file_path (str): The path to the file to delete.
     """
+    for attempt, delay in enumerate(_DELETE_RETRY_DELAYS):
+        if delay:
+            time.sleep(delay)
+        try:
+            os.unlink(file_path)
+            if attempt:
+                logger.info("Successfully deleted file after retry: %s", file_path)
+            else:
+                logger.info("Deleted file: %s", file_path)
+            return
+        except FileNotFoundError:
+            logger.warning("File not found: %s", file_path)
+            return
+        except PermissionError:
+            logger.warning("Permission denied when trying to delete file: %s - file may be in use", file_path)
+        except OSError as e:
+            logger.error("Error deleting file %s: %s", file_path, e)
+            return
+    logger.warning("Still cannot delete file %s after %d attempts", file_path, len(_DELETE_RETRY_DELAYS))
+
+def delete_file_async(file_path):
+    """
+    Schedule a file for deletion on a background thread and return immediately.
+
+    Args:
+    file_path (str): The path to the file to delete.
+
+    Returns:
+    concurrent.futures.Future: Completes once the delete attempt has finished.
+    """
+    return _delete_pool.submit(delete_file, file_path)
+
+def sweep_stale_files(directory, max_age):
+    """
+    Delete files in a directory that have not been modified for a while.
+
+    Args:
+    directory (str): The directory to sweep (not recursive).
+    max_age (float): Minimum age in seconds of a file to delete.
+
+    Returns:
+    int: Number of files deleted.
+    """
+    cutoff = time.time() - max_age
+    deleted = 0
     try:
-        # Add a small delay to avoid file locking issues
-        time.sleep(0.1)
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logging.info(f"Deleted file: {file_path}")
-        else:
-            logging.warning(f"File not found: {file_path}")
+        entries = list(os.scandir(directory))
     except FileNotFoundError:
-        logging.warning(f"File not found: {file_path}")
-    except PermissionError:
-        logging.warning(f"Permission denied when trying to delete file: {file_path} - file may be in use")
-        # Try again after a longer delay
+        return 0
+    for entry in entries:
         try:
-            time.sleep(1)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logging.info(f"Successfully deleted file after retry: {file_path}")
-        except Exception as retry_error:
-            logging.warning(f"Still cannot delete file {file_path}: {retry_error}")
-    except OSError as e:
-        logging.error(f"Error deleting file {file_path}: {e}")
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.unlink(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning("Could not sweep file %s: %s", entry.path, e)
+    if deleted:
+        logger.info("Swept %d stale file(s) from %s", deleted, directory)
+    return deleted
+
+def start_periodic_sweep(directory, interval, max_age):
+    """
+    Sweep a directory for stale files every interval seconds on a daemon thread.
+
+    Args:
+    directory (str): The directory to sweep.
+    interval (float): Seconds between sweeps.
+    max_age (float): Minimum age in seconds of a file to delete.
+
+    Returns:
+    threading.Thread: The started sweeper thread.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                sweep_stale_files(directory, max_age)
+            except Exception as e:
+                logger.error("Sweep of %s failed: %s", directory, e)
+
+    thread = threading.Thread(target=run, name=f"sweep:{directory}", daemon=True)
+    thread.start()
+    return thread
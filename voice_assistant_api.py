@@ -1,106 +1,583 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import logging
 import os
 import tempfile
 import base64
-from werkzeug.utils import secure_filename
+import hashlib
 import io
+from collections import OrderedDict, deque
+from urllib.parse import quote
 import threading
+import uuid
+import wave
+import queue
 import asyncio
-import concurrent.futures
 from functools import lru_cache
+import httpx
+import orjson
+
+# WebSocket support is optional; /ws/audio is only served when flask-sock is installed
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+# Response compression is optional too; responses go out uncompressed without flask-compress
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 
-from voice_assistant.audio import record_audio, play_audio
 from voice_assistant.transcription import transcribe_audio
 from voice_assistant.response_generation import generate_response
 from voice_assistant.text_to_speech import text_to_speech
-from voice_assistant.utils import delete_file
+from voice_assistant.utils import delete_file_async, start_periodic_sweep
 from voice_assistant.config import Config
 from voice_assistant.api_key_manager import get_transcription_api_key, get_response_api_key, get_tts_api_key
-from voice_assistant.optimized_transcription import transcribe_with_cached_deepgram
-from voice_assistant.optimized_response import generate_response_with_cached_groq
-from voice_assistant.optimized_tts import tts_with_cached_deepgram
+from voice_assistant.optimized_transcription import transcribe_with_cached_deepgram, open_live_transcription_with_cached_deepgram
+from voice_assistant.optimized_response import generate_response_with_cached_groq, stream_response_with_cached_groq
+from voice_assistant.optimized_tts import (
+    DEEPGRAM_TTS_MODEL, tts_bytes_with_cached_deepgram, tts_stream_with_cached_deepgram, tts_sentences_with_cached_deepgram
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, much faster on the large base64 audio payloads"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
+# Compress JSON (chat history dumps, base64 audio) and the HTML page when the
+# client accepts it; audio streams are left alone
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_MIN_SIZE'] = 2048
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+if Compress is not None:
+    Compress(app)
+
 # Performance optimizations
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['TEMPLATES_AUTO_RELOAD'] = False
 
-# Thread pool for concurrent processing
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=6)
+# Global clients for connection reuse (major latency improvement); plain module
+# names so the warm path of each getter is a single global lookup
+_DEEPGRAM = None
+_GROQ = None
+_OPENAI = None
+
+# Keep-alive pool shared by the SDK HTTP clients so every worker thread reuses warm TLS connections
+HTTP_POOL_LIMITS = httpx.Limits(max_keepalive_connections=50, max_connections=50, keepalive_expiry=60)
 
-# Global clients for connection reuse (major latency improvement)
-global_clients = {
-    'deepgram': None,
-    'groq': None,
-    'openai': None
-}
+# Guards client creation so the startup pre-warm and lazy getters never race
+_CLIENT_LOCK = threading.Lock()
+# Serializes init_clients so concurrent first requests warm up only once
+_init_lock = threading.Lock()
+_clients_initialized = False
 
 def get_cached_deepgram_client():
     """Get cached Deepgram client for connection reuse"""
-    if global_clients['deepgram'] is None:
-        from deepgram import DeepgramClient
-        global_clients['deepgram'] = DeepgramClient(get_cached_transcription_api_key())
-    return global_clients['deepgram']
+    global _DEEPGRAM
+    client = _DEEPGRAM
+    if client is not None:
+        return client
+    with _CLIENT_LOCK:
+        if _DEEPGRAM is None:
+            from deepgram import DeepgramClient, DeepgramClientOptions
+            _DEEPGRAM = DeepgramClient(
+                Config.DEEPGRAM_API_KEY,
+                DeepgramClientOptions(options={"keepalive": "true"})
+            )
+        return _DEEPGRAM
 
 def get_cached_groq_client():
     """Get cached Groq client for connection reuse"""
-    if global_clients['groq'] is None:
-        from groq import Groq
-        global_clients['groq'] = Groq(api_key=get_cached_response_api_key())
-    return global_clients['groq']
+    global _GROQ
+    client = _GROQ
+    if client is not None:
+        return client
+    with _CLIENT_LOCK:
+        if _GROQ is None:
+            from groq import Groq
+            _GROQ = Groq(
+                api_key=RESPONSE_API_KEY,
+                http_client=httpx.Client(limits=HTTP_POOL_LIMITS)
+            )
+        return _GROQ
 
 def get_cached_openai_client():
     """Get cached OpenAI client for connection reuse"""
-    if global_clients['openai'] is None:
-        from openai import OpenAI
-        global_clients['openai'] = OpenAI(api_key=get_cached_tts_api_key())
-    return global_clients['openai']
-
-# Global chat history for maintaining conversation context
-chat_history = [
-    {"role": "system", "content": """ You are a UAE Property Assistant called Verbi. 
+    global _OPENAI
+    client = _OPENAI
+    if client is not None:
+        return client
+    with _CLIENT_LOCK:
+        if _OPENAI is None:
+            from openai import OpenAI
+            _OPENAI = OpenAI(
+                api_key=TTS_API_KEY,
+                http_client=httpx.Client(limits=HTTP_POOL_LIMITS)
+            )
+        return _OPENAI
+
+def init_clients():
+    """
+    Create the SDK clients and open their connections before the first request,
+    so the first user turn does not pay for SDK imports and the TLS handshake.
+    
+    Failures are logged and left to the lazy getters to retry on demand.
+    """
+    global _clients_initialized
+    with _init_lock:
+        if _clients_initialized:
+            return
+        _warm_clients()
+        _clients_initialized = True
+    logging.info("API clients pre-warmed")
+
+def _warm_clients():
+    """Instantiate each client and issue a keepalive request where useful"""
+    # Deepgram and Groq are on every voice turn, so also issue a cheap request to
+    # pull a live connection into their pools; OpenAI is only instantiated
+    warmups = (
+        ('deepgram', get_cached_deepgram_client, lambda client: client.manage.v("1").get_projects()),
+        ('groq', get_cached_groq_client, lambda client: client.models.list()),
+        ('openai', get_cached_openai_client, None),
+    )
+    for name, get_client, keepalive in warmups:
+        try:
+            client = get_client()
+            if keepalive is not None:
+                keepalive(client)
+        except Exception as e:
+            logging.warning(f"Could not pre-warm {name} client: {e}")
+
+# Default system prompt for new conversations
+DEFAULT_SYSTEM_PROMPT = """ You are a UAE Property Assistant called Verbi. 
      You are professional and very concise, specializing in UAE real estate information.
      You can help users with property queries, greetings, pricing, and accounting questions.
-     Provide very short answers under 25 words. Key facts only. """}
-]
+     Provide very short answers under 25 words. Key facts only. """
+
+# Conversation turns (user + assistant pairs) kept per session; older turns are
+# dropped so every LLM call ships a bounded prompt
+MAX_TURNS = 10
+
+# Approximate prompt budget (system message, history and the new user message)
+# for each LLM call; the oldest messages are evicted until a prompt fits
+MAX_INPUT_TOKENS = 600
+
+# Session used by clients that do not send a session id
+DEFAULT_SESSION_ID = 'default'
+
+class RollingHistory:
+    """Pinned system message plus a bounded window of recent user/assistant messages"""
+
+    def __init__(self, system_prompt, max_turns=MAX_TURNS, max_input_tokens=MAX_INPUT_TOKENS):
+        self.system_msg = {"role": "system", "content": system_prompt}
+        self.system_tokens = self.estimate_tokens(system_prompt)
+        self.max_input_tokens = max_input_tokens
+        # (message, token estimate) pairs so evictions keep the running total exact
+        self.messages = deque(maxlen=2 * max_turns)
+        self.token_count = 0
+
+    @staticmethod
+    def estimate_tokens(content):
+        """Rough token count of a message, about 1.3 tokens per word"""
+        return int(len(content.split()) * 1.3)
+
+    def append(self, role, content):
+        """Add a message, letting the oldest one fall out once the window is full"""
+        if len(self.messages) == self.messages.maxlen:
+            self.token_count -= self.messages[0][1]
+        tokens = self.estimate_tokens(content)
+        self.messages.append(({"role": role, "content": content}, tokens))
+        self.token_count += tokens
+
+    def to_chat_history(self, user_message=None):
+        """
+        Build the chat history for an LLM call, system message first.
+
+        Args:
+        user_message (str): Pending user message to end the history with, if any.
+
+        Returns:
+        list: Message dicts whose estimated size fits max_input_tokens; the oldest
+        messages are evicted until it does.
+        """
+        budget = self.max_input_tokens - self.system_tokens
+        if user_message is not None:
+            budget -= self.estimate_tokens(user_message)
+        while self.messages and self.token_count > budget:
+            self.token_count -= self.messages.popleft()[1]
+
+        chat_history = [self.system_msg]
+        chat_history.extend(message for message, _ in self.messages)
+        if user_message is not None:
+            chat_history.append({"role": "user", "content": user_message})
+        return chat_history
+
+# Most sessions kept at once; beyond this the least recently used are dropped, so
+# conversations that are never stopped (closed tabs, crashed clients) do not pile up
+MAX_SESSIONS = 1000
+
+# Per-session conversation context: session id -> RollingHistory, least recently used first
+SESSIONS = OrderedDict()
+
+# Striped locks so concurrent sessions rarely contend; re-entrant so a turn can
+# hold its session lock across the helpers below
+SESSION_LOCK_STRIPES = 64
+_session_locks = tuple(threading.RLock() for _ in range(SESSION_LOCK_STRIPES))
 
-# Cache for API keys to avoid repeated lookups
-@lru_cache(maxsize=10)
-def get_cached_transcription_api_key():
-    return get_transcription_api_key()
+# Guards the order and size of SESSIONS. Taken after a session's stripe lock, so
+# while it is held other stripes are only ever try-locked
+_sessions_lock = threading.Lock()
 
-@lru_cache(maxsize=10)
-def get_cached_response_api_key():
-    return get_response_api_key()
+def session_lock(session_id):
+    """Get the lock guarding a session"""
+    return _session_locks[hash(session_id) % SESSION_LOCK_STRIPES]
 
-@lru_cache(maxsize=10)
-def get_cached_tts_api_key():
-    return get_tts_api_key()
+def _evict_sessions():
+    """Drop least recently used sessions beyond MAX_SESSIONS; caller holds _sessions_lock"""
+    excess = len(SESSIONS) - MAX_SESSIONS
+    if excess <= 0:
+        return
+    for session_id in list(SESSIONS):
+        lock = session_lock(session_id)
+        # Sessions whose stripe is busy may be mid-turn; skip them rather than wait
+        if lock.acquire(blocking=False):
+            try:
+                del SESSIONS[session_id]
+            finally:
+                lock.release()
+            excess -= 1
+            if not excess:
+                return
+
+def get_session_id():
+    """Read the session id from the X-Session-ID header, JSON body, form data or query string"""
+    data = request.get_json(silent=True) or {}
+    return (
+        request.headers.get('X-Session-ID')
+        or data.get('session_id')
+        or request.form.get('session_id')
+        or request.args.get('session_id')
+        or DEFAULT_SESSION_ID
+    )
+
+def reset_session(session_id, system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Start a session over with only its system message and return it"""
+    with session_lock(session_id):
+        session = RollingHistory(system_prompt)
+        with _sessions_lock:
+            SESSIONS[session_id] = session
+            SESSIONS.move_to_end(session_id)
+            _evict_sessions()
+        return session
+
+def get_session(session_id):
+    """Get a session's RollingHistory, starting a new one if needed"""
+    with session_lock(session_id):
+        with _sessions_lock:
+            session = SESSIONS.get(session_id)
+            if session is not None:
+                SESSIONS.move_to_end(session_id)
+                return session
+        return reset_session(session_id)
+
+def drop_session(session_id):
+    """Forget a session and its history"""
+    with session_lock(session_id):
+        with _sessions_lock:
+            SESSIONS.pop(session_id, None)
+
+def get_session_history(session_id, user_message=None):
+    """Get a session's context as a chat history list, trimmed to the prompt budget"""
+    with session_lock(session_id):
+        return get_session(session_id).to_chat_history(user_message)
+
+def record_turn(session_id, user_input, response_text):
+    """Append a completed user/assistant exchange to a session"""
+    with session_lock(session_id):
+        session = get_session(session_id)
+        session.append("user", user_input)
+        session.append("assistant", response_text)
+
+# API keys resolved once at import; the configured models never change at runtime
+TRANSCRIPTION_API_KEY = get_transcription_api_key()
+RESPONSE_API_KEY = get_response_api_key()
+TTS_API_KEY = get_tts_api_key()
 
 # Configure upload folder
 UPLOAD_FOLDER = 'temp_uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# Temp files are deleted in the background after each request; anything a crash
+# leaves behind is swept once it is an hour old
+UPLOAD_SWEEP_INTERVAL = 3600
+UPLOAD_MAX_AGE = 3600
+start_periodic_sweep(UPLOAD_FOLDER, UPLOAD_SWEEP_INTERVAL, UPLOAD_MAX_AGE)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'ogg'}
+# Content-addressed store of synthesized phrases that repeat across requests (greeting etc.)
+# Anchored at the app root: send_file resolves relative paths there, not against the CWD
+TTS_CACHE_DIR = os.path.join(app.root_path, 'tts_cache')
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+
+# Output format of the configured TTS model, fixed for the life of the process
+TTS_FORMAT = 'mp3' if Config.TTS_MODEL in {'openai', 'elevenlabs', 'melotts', 'cartesia'} else 'wav'
+TTS_MIMETYPE = 'audio/mpeg' if TTS_FORMAT == 'mp3' else 'audio/wav'
+
+# Upload suffixes as returned by os.path.splitext
+ALLOWED_EXTENSIONS = frozenset({'.wav', '.mp3', '.m4a', '.flac', '.ogg'})
+
+@app.before_request
+def ensure_clients():
+    """Pre-warm clients when the app is served without running __main__ (e.g. under a WSGI server)"""
+    if not _clients_initialized:
+        init_clients()
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+def transcribe_upload(file):
+    """
+    Transcribe an uploaded audio file.
+    
+    Deepgram uploads are sent straight from memory with the cached client; other
+    models and unusually large uploads go through a temporary file on disk.
+    """
+    if Config.TRANSCRIPTION_MODEL == 'deepgram' and (request.content_length or 0) <= app.config['MAX_CONTENT_LENGTH'] // 2:
+        return transcribe_with_cached_deepgram(get_cached_deepgram_client(), audio_bytes=file.read())
+    
+    # Save uploaded file under a unique temporary name so concurrent uploads never collide
+    extension = os.path.splitext(file.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix=extension, delete=False) as temp_file:
+        file.save(temp_file)
+        temp_path = temp_file.name
+    try:
+        return transcribe_audio(
+            Config.TRANSCRIPTION_MODEL, 
+            TRANSCRIPTION_API_KEY, 
+            temp_path, 
+            Config.LOCAL_MODEL_PATH
+        )
+    finally:
+        # Clean up temp file
+        delete_file_async(temp_path)
+
+def tts_cache_path(text, lang):
+    """Location of a phrase's audio in TTS_CACHE_DIR"""
+    key = hashlib.blake2b(f"{lang}|{DEEPGRAM_TTS_MODEL}|{text}".encode(), digest_size=16).hexdigest()
+    return os.path.join(TTS_CACHE_DIR, f"{key}.wav")
+
+def cached_tts_file(text, lang):
+    """Path of a phrase's cached WAV, synthesizing it first if needed; for serving with send_file"""
+    cache_path = tts_cache_path(text, lang)
+    if not os.path.exists(cache_path):
+        cached_tts(text, lang)
+    return cache_path
+
+def cached_tts(text, lang):
+    """
+    Get Deepgram WAV audio for a phrase, synthesizing it only the first time.
+    
+    Audio is stored under TTS_CACHE_DIR keyed by a hash of language, voice and text,
+    so repeated phrases are served from disk instead of a TTS round-trip.
+    """
+    cache_path = tts_cache_path(text, lang)
+    try:
+        with open(cache_path, 'rb') as audio_file:
+            return audio_file.read()
+    except FileNotFoundError:
+        pass
+    
+    # Write to a private temp name and publish atomically so readers never see a partial file
+    audio_data = tts_bytes_with_cached_deepgram(get_cached_deepgram_client(), text)
+    temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as audio_file:
+        audio_file.write(audio_data)
+    os.replace(temp_path, cache_path)
+    return audio_data
+
+@lru_cache(maxsize=32)
+def cached_tts_base64(text, lang):
+    """Base64-encoded cached_tts audio for the hottest phrases, kept in memory"""
+    return base64.b64encode(cached_tts(text, lang)).decode('utf-8')
+
+def synthesize_speech(text):
+    """Convert text to speech with the configured TTS model and return the audio bytes (TTS_FORMAT)"""
+    # Deepgram synthesizes straight into memory with the cached client
+    if Config.TTS_MODEL == 'deepgram':
+        return tts_bytes_with_cached_deepgram(get_cached_deepgram_client(), text)
+    
+    # Other models write a file, so give each call its own temporary one
+    with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix=f".{TTS_FORMAT}", delete=False) as temp_file:
+        output_file = temp_file.name
+    try:
+        text_to_speech(
+            Config.TTS_MODEL, 
+            TTS_API_KEY, 
+            text, 
+            output_file, 
+            Config.LOCAL_MODEL_PATH
+        )
+        with open(output_file, 'rb') as audio_file:
+            audio_data = audio_file.read()
+    finally:
+        # Clean up the file
+        delete_file_async(output_file)
+    
+    # text_to_speech logs its failures instead of raising, and some backends (cartesia)
+    # play through the local speaker rather than writing the file
+    if not audio_data:
+        logging.error(f"TTS model {Config.TTS_MODEL} produced no audio")
+        raise RuntimeError(f"TTS model {Config.TTS_MODEL} produced no audio")
+    return audio_data
+
+# Chunk size for streaming synthesized audio back to the client
+AUDIO_CHUNK_SIZE = 16384
+
+def speech_response(text, headers=None):
+    """
+    Respond with the synthesized speech for text as raw binary (no base64 JSON envelope).
+    
+    Deepgram audio is streamed in AUDIO_CHUNK_SIZE chunks while it is being
+    synthesized, so playback can start early; other TTS models write a file, so
+    their audio is sent whole with a Content-Length.
+    """
+    if Config.TTS_MODEL == 'deepgram':
+        chunks = tts_stream_with_cached_deepgram(get_cached_deepgram_client(), text, AUDIO_CHUNK_SIZE)
+        return Response(stream_with_context(chunks), mimetype=TTS_MIMETYPE, headers=headers)
+    return Response(synthesize_speech(text), mimetype=TTS_MIMETYPE, headers=headers)
+
+async def respond_with_streaming_tts(groq_client, deepgram_client, history):
+    """
+    Overlap LLM generation and speech synthesis for one turn.
+    
+    Sentences streamed from Groq are synthesized by Deepgram as soon as each is
+    complete, then the per-sentence WAVs are joined into a single WAV in memory.
+    
+    Returns:
+    tuple: (response_text, wav_bytes)
+    """
+    sentences = []
+    
+    def collect_sentences():
+        # Runs on the TTS helper's worker thread; keeps the text for chat history
+        for sentence in stream_response_with_cached_groq(groq_client, history):
+            sentences.append(sentence)
+            yield sentence
+    
+    wav_parts = [
+        wav_part
+        async for wav_part in tts_sentences_with_cached_deepgram(deepgram_client, collect_sentences())
+    ]
+    return " ".join(sentences), join_wav_audio(wav_parts)
+
+def respond_to_turn(session_id, user_input):
+    """
+    Answer a transcribed user turn within its session using the cached clients.
+    
+    Returns:
+    tuple: (response_text, wav_bytes)
+    """
+    groq_client = get_cached_groq_client()
+    deepgram_client = get_cached_deepgram_client()
+    with session_lock(session_id):
+        chat_history = get_session_history(session_id, user_input)
+        response_text, wav_audio = asyncio.run(
+            respond_with_streaming_tts(groq_client, deepgram_client, chat_history)
+        )
+        record_turn(session_id, user_input, response_text)
+    return response_text, wav_audio
+
+def _run_voice_turn(audio_source, session_id):
+    """
+    Run one voice turn: transcribe an uploaded recording, answer it within the
+    session and synthesize the reply.
+    
+    Groq replies always go through the cached, property-KB-aware client; with
+    Deepgram TTS they are also synthesized sentence by sentence as they stream
+    (respond_to_turn). Other response models use generate_response, and every
+    non-Deepgram TTS model goes through synthesize_speech.
+    
+    Returns:
+    tuple: (user_input, response_text, audio_bytes); all empty if nothing was transcribed
+    """
+    user_input = transcribe_upload(audio_source)
+    if not user_input or not user_input.strip():
+        return '', '', b''
+    
+    if Config.RESPONSE_MODEL == 'groq' and Config.TTS_MODEL == 'deepgram':
+        response_text, audio_data = respond_to_turn(session_id, user_input)
+        return user_input, response_text, audio_data
+    
+    response_text = answer_turn(session_id, user_input)
+    return user_input, response_text, synthesize_speech(response_text)
+
+def answer_turn(session_id, user_input):
+    """
+    Generate the text reply to a transcribed user turn within its session.
+    
+    Groq goes through the cached, property-KB-aware client; other response models
+    through generate_response.
+    """
+    with session_lock(session_id):
+        chat_history = get_session_history(session_id, user_input)
+        if Config.RESPONSE_MODEL == 'groq':
+            response_text = generate_response_with_cached_groq(get_cached_groq_client(), chat_history)
+        else:
+            response_text = generate_response(
+                Config.RESPONSE_MODEL, 
+                RESPONSE_API_KEY, 
+                chat_history, 
+                Config.LOCAL_MODEL_PATH
+            )
+        record_turn(session_id, user_input, response_text)
+    return response_text
+
+def join_wav_audio(wav_parts):
+    """Concatenate in-memory WAVs that share one format into a single WAV"""
+    if not wav_parts:
+        return b''
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as joined:
+        for index, wav_part in enumerate(wav_parts):
+            with wave.open(io.BytesIO(wav_part), 'rb') as part:
+                if index == 0:
+                    joined.setparams(part.getparams())
+                joined.writeframes(part.readframes(part.getnframes()))
+    return buffer.getvalue()
+
+# The voice agent page is static, so read it once and let browsers revalidate by ETag
+with open(os.path.join(app.root_path, 'voice_agent.html'), 'rb') as index_file:
+    INDEX_HTML = index_file.read()
+INDEX_ETAG = hashlib.blake2b(INDEX_HTML, digest_size=16).hexdigest()
+INDEX_HEADERS = {'Cache-Control': 'public, max-age=300'}
+# flask-compress tags compressed responses' ETags with the algorithm, so accept those too
+INDEX_ETAGS = (INDEX_ETAG, f"{INDEX_ETAG}:br", f"{INDEX_ETAG}:gzip")
 
 @app.route('/', methods=['GET'])
 def root():
     """Serve the voice agent HTML page"""
-    return send_file('voice_agent.html')
+    if any(request.if_none_match.contains(etag) for etag in INDEX_ETAGS):
+        response = Response(status=304, headers=INDEX_HEADERS)
+    else:
+        response = Response(INDEX_HTML, mimetype='text/html', headers=INDEX_HEADERS)
+    response.set_etag(INDEX_ETAG)
+    return response
 
 @app.route('/api-info', methods=['GET'])
 def api_info():
@@ -113,8 +590,11 @@ def api_info():
             'transcribe': '/transcribe (POST)',
             'chat': '/chat (POST)',
             'tts': '/tts (POST)',
+            'tts-stream': '/tts/stream (POST)',
             'voice-chat': '/voice-chat (POST)',
-            'chat-history': '/chat-history (GET/DELETE)'
+            'voice-chat-stream': '/voice-chat/stream (POST)',
+            'chat-history': '/chat-history (GET/DELETE)',
+            'audio-stream': '/ws/audio (WebSocket)'
         }
     })
 
@@ -145,22 +625,8 @@ def transcribe_endpoint():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Allowed: wav, mp3, m4a, flac, ogg'}), 400
         
-        # Save uploaded file temporarily
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_path)
-        
-        # Get API key and transcribe (optimized)
-        transcription_api_key = get_cached_transcription_api_key()
-        transcription = transcribe_audio(
-            Config.TRANSCRIPTION_MODEL, 
-            transcription_api_key, 
-            temp_path, 
-            Config.LOCAL_MODEL_PATH
-        )
-        
-        # Clean up temp file
-        delete_file(temp_path)
+        # Transcribe, in memory when possible (optimized)
+        transcription = transcribe_upload(file)
         
         if not transcription:
             return jsonify({'error': 'No transcription generated'}), 400
@@ -183,21 +649,22 @@ def chat_endpoint():
             return jsonify({'error': 'No message provided'}), 400
         
         user_message = data['message']
+        session_id = get_session_id()
         
-        # Append user message to chat history
-        chat_history.append({"role": "user", "content": user_message})
-        
-        # Generate response (optimized)
-        response_api_key = get_cached_response_api_key()
-        response_text = generate_response(
-            Config.RESPONSE_MODEL, 
-            response_api_key, 
-            chat_history, 
-            Config.LOCAL_MODEL_PATH
-        )
-        
-        # Append assistant response to chat history
-        chat_history.append({"role": "assistant", "content": response_text})
+        with session_lock(session_id):
+            # Session context plus the new user message
+            chat_history = get_session_history(session_id, user_message)
+            
+            # Generate response (optimized)
+            response_text = generate_response(
+                Config.RESPONSE_MODEL, 
+                RESPONSE_API_KEY, 
+                chat_history, 
+                Config.LOCAL_MODEL_PATH
+            )
+            
+            # Keep the exchange in the session
+            record_turn(session_id, user_message, response_text)
         
         return jsonify({
             'response': response_text,
@@ -218,35 +685,15 @@ def tts_endpoint():
         
         text = data['text']
         
-        # Determine output file format
-        if Config.TTS_MODEL in ['openai', 'elevenlabs', 'melotts', 'cartesia']:
-            output_file = 'output.mp3'
-        else:
-            output_file = 'output.wav'
-        
         # Generate speech (optimized)
-        tts_api_key = get_cached_tts_api_key()
-        text_to_speech(
-            Config.TTS_MODEL, 
-            tts_api_key, 
-            text, 
-            output_file, 
-            Config.LOCAL_MODEL_PATH
-        )
-        
-        # Read the generated audio file
-        with open(output_file, 'rb') as audio_file:
-            audio_data = audio_file.read()
-        
-        # Clean up the file
-        delete_file(output_file)
+        audio_data = synthesize_speech(text)
         
         # Return audio as base64 encoded string
         audio_base64 = base64.b64encode(audio_data).decode('utf-8')
         
         return jsonify({
             'audio': audio_base64,
-            'format': 'mp3' if output_file.endswith('.mp3') else 'wav',
+            'format': TTS_FORMAT,
             'model': Config.TTS_MODEL
         })
         
@@ -254,6 +701,20 @@ def tts_endpoint():
         logging.error(f"TTS error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/tts/stream', methods=['POST'])
+def tts_stream_endpoint():
+    """Convert text to speech and stream the audio back without a base64 JSON envelope"""
+    try:
+        data = request.get_json()
+        if not data or 'text' not in data:
+            return jsonify({'error': 'No text provided'}), 400
+        
+        return speech_response(data['text'])
+        
+    except Exception as e:
+        logging.error(f"TTS stream error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/voice-chat', methods=['POST'])
 def voice_chat_endpoint():
     """Complete voice chat: transcribe audio, generate response, and return audio"""
@@ -268,59 +729,10 @@ def voice_chat_endpoint():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Allowed: wav, mp3, m4a, flac, ogg'}), 400
         
-        # Save uploaded file temporarily
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_path)
-        
-        # Step 1: Transcribe audio
-        transcription_api_key = get_transcription_api_key()
-        user_input = transcribe_audio(
-            Config.TRANSCRIPTION_MODEL, 
-            transcription_api_key, 
-            temp_path, 
-            Config.LOCAL_MODEL_PATH
-        )
-        
-        # Clean up input audio file
-        delete_file(temp_path)
-        
+        user_input, response_text, audio_data = _run_voice_turn(file, get_session_id())
         if not user_input:
             return jsonify({'error': 'No transcription generated'}), 400
         
-        # Step 2: Generate response
-        chat_history.append({"role": "user", "content": user_input})
-        response_api_key = get_response_api_key()
-        response_text = generate_response(
-            Config.RESPONSE_MODEL, 
-            response_api_key, 
-            chat_history, 
-            Config.LOCAL_MODEL_PATH
-        )
-        chat_history.append({"role": "assistant", "content": response_text})
-        
-        # Step 3: Convert response to speech
-        if Config.TTS_MODEL in ['openai', 'elevenlabs', 'melotts', 'cartesia']:
-            output_file = 'output.mp3'
-        else:
-            output_file = 'output.wav'
-        
-        tts_api_key = get_tts_api_key()
-        text_to_speech(
-            Config.TTS_MODEL, 
-            tts_api_key, 
-            response_text, 
-            output_file, 
-            Config.LOCAL_MODEL_PATH
-        )
-        
-        # Read the generated audio file
-        with open(output_file, 'rb') as audio_file:
-            audio_data = audio_file.read()
-        
-        # Clean up the file
-        delete_file(output_file)
-        
         # Return complete response
         audio_base64 = base64.b64encode(audio_data).decode('utf-8')
         
@@ -328,7 +740,7 @@ def voice_chat_endpoint():
             'user_input': user_input,
             'response': response_text,
             'audio': audio_base64,
-            'audio_format': 'mp3' if output_file.endswith('.mp3') else 'wav',
+            'audio_format': TTS_FORMAT,
             'models': {
                 'transcription': Config.TRANSCRIPTION_MODEL,
                 'response': Config.RESPONSE_MODEL,
@@ -340,20 +752,53 @@ def voice_chat_endpoint():
         logging.error(f"Voice chat error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/voice-chat/stream', methods=['POST'])
+def voice_chat_stream_endpoint():
+    """
+    Complete voice chat that streams the reply audio as raw binary.
+    
+    The transcription and response text are returned URL-encoded in the
+    X-Transcription and X-Response-Text headers, so the reply text is generated
+    first and its audio is then streamed as it is synthesized (see speech_response).
+    """
+    try:
+        if 'audio' not in request.files:
+            return jsonify({'error': 'No audio file provided'}), 400
+        
+        file = request.files['audio']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type. Allowed: wav, mp3, m4a, flac, ogg'}), 400
+        
+        user_input = transcribe_upload(file)
+        if not user_input or not user_input.strip():
+            return jsonify({'error': 'No transcription generated'}), 400
+        
+        response_text = answer_turn(get_session_id(), user_input)
+        
+        # Stream the reply audio out
+        return speech_response(response_text, headers={
+            'X-Transcription': quote(user_input),
+            'X-Response-Text': quote(response_text)
+        })
+        
+    except Exception as e:
+        logging.error(f"Voice chat stream error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/chat-history', methods=['GET'])
 def get_chat_history():
     """Get current chat history"""
-    return jsonify({'chat_history': chat_history})
+    return jsonify({'chat_history': get_session_history(get_session_id())})
 
 @app.route('/chat-history', methods=['DELETE'])
 def clear_chat_history():
     """Clear chat history and reset to initial system message"""
-    global chat_history
-    chat_history = [
-        {"role": "system", "content": """ You are a helpful Assistant called Verbi. 
+    reset_session(get_session_id(), """ You are a helpful Assistant called Verbi. 
          You are friendly and fun and you will help the users with their requests.
-         Your answers are short and concise. """}
-    ]
+         Your answers are short and concise. """)
     return jsonify({'message': 'Chat history cleared'})
 
 @app.route('/api/start_conversation', methods=['POST'])
@@ -363,33 +808,30 @@ def start_conversation():
         data = request.get_json()
         language = data.get('language', 'English')
         
-        # Clear previous chat history
-        global chat_history
-        chat_history = [
-            {"role": "system", "content": f""" You are a UAE Property Assistant called Verbi. 
+        # Every conversation gets its own session and chat history
+        session_id = str(uuid.uuid4())
+        reset_session(session_id, f""" You are a UAE Property Assistant called Verbi. 
              You are professional and very concise, specializing in UAE real estate information.
              You can help users with property queries, greetings, pricing, and accounting questions.
-             Provide very short answers under 25 words. Key facts only. Please respond in {language}. """}
-        ]
+             Provide very short answers under 25 words. Key facts only. Please respond in {language}. """)
         
         # Generate greeting
         greeting_text = f"Hello! I'm Verbi. UAE Property assistant. How can I help?"
         
-        # OPTIMIZATION: Use cached Deepgram client for TTS
-        deepgram_tts_client = get_cached_deepgram_client()
-        greeting_file = 'greeting.wav'  # Deepgram TTS uses WAV
+        # Binary clients (Accept: audio/wav) get the cached greeting file via send_file,
+        # which hands it to sendfile(2) under gunicorn; text and session id go in headers
+        if request.accept_mimetypes.best_match(['application/json', 'audio/wav']) == 'audio/wav':
+            response = send_file(cached_tts_file(greeting_text, language), mimetype='audio/wav', conditional=True)
+            response.headers['X-Session-ID'] = session_id
+            response.headers['X-Greeting-Text'] = quote(greeting_text)
+            return response
         
-        tts_with_cached_deepgram(deepgram_tts_client, greeting_text, greeting_file)
-        
-        # Read and encode greeting audio
-        with open(greeting_file, 'rb') as audio_file:
-            greeting_audio = base64.b64encode(audio_file.read()).decode('utf-8')
-        
-        # Clean up greeting file
-        delete_file(greeting_file)
+        # OPTIMIZATION: The greeting never changes, so serve its audio from the TTS cache
+        greeting_audio = cached_tts_base64(greeting_text, language)
         
         return jsonify({
             'status': 'success',
+            'session_id': session_id,
             'greeting_text': greeting_text,
             'greeting_audio': greeting_audio
         })
@@ -402,6 +844,10 @@ def start_conversation():
 def stop_conversation():
     """Stop the current conversation"""
     try:
+        # Drop the session so finished conversations do not accumulate
+        session_id = get_session_id()
+        if session_id != DEFAULT_SESSION_ID:
+            drop_session(session_id)
         return jsonify({'status': 'success', 'message': 'Conversation stopped'})
     except Exception as e:
         logging.error(f"Error stopping conversation: {e}")
@@ -436,56 +882,30 @@ def stop_current_audio():
 
 @app.route('/api/process_user_input', methods=['POST'])
 def process_user_input():
-    """Process user audio input and generate response - OPTIMIZED FOR LATENCY"""
+    """
+    Process user audio input and generate response - OPTIMIZED FOR LATENCY
+    
+    Kept for clients that upload whole recordings; /ws/audio transcribes while the
+    user is still speaking and answers sooner.
+    """
     try:
         if 'audio' not in request.files:
             return jsonify({'status': 'error', 'message': 'No audio file provided'}), 400
         
         file = request.files['audio']
-        language = request.form.get('language', 'English')
-        
         if file.filename == '':
             return jsonify({'status': 'error', 'message': 'No file selected'}), 400
         
-        # Save uploaded file temporarily (safe file handling)
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_path)
-        
-        # OPTIMIZATION 2: Use cached clients for connection reuse
-        deepgram_client = get_cached_deepgram_client()
-        
-        # Step 1: Transcribe audio (optimized with cached client)
-        user_input = transcribe_with_cached_deepgram(deepgram_client, temp_path)
-        
-        # Clean up input audio file
-        delete_file(temp_path)
-        
-        if not user_input or user_input.strip() == '':
+        # Transcribe, stream the response and synthesize each sentence while Groq
+        # is still generating the next one (optimized with cached clients)
+        user_input, response_text, wav_audio = _run_voice_turn(file, get_session_id())
+        if not user_input:
             return jsonify({'status': 'error', 'message': 'No transcription generated'}), 400
         
-        # OPTIMIZATION 3: Use cached Groq client for connection reuse
-        groq_client = get_cached_groq_client()
-        
-        # Step 2: Generate response (optimized with cached client)
-        chat_history.append({"role": "user", "content": user_input})
-        response_text = generate_response_with_cached_groq(groq_client, chat_history)
-        chat_history.append({"role": "assistant", "content": response_text})
-        
-        # OPTIMIZATION 4: Use cached Deepgram client for TTS
-        deepgram_tts_client = get_cached_deepgram_client()
-        
-        # Step 3: Convert response to speech (optimized with cached client)
-        output_file = 'output.wav'  # Deepgram TTS uses WAV
+        logging.info(f"User: {user_input}")
+        logging.info(f"Assistant: {response_text}")
         
-        tts_with_cached_deepgram(deepgram_tts_client, response_text, output_file)
-        
-        # Read the generated audio file
-        with open(output_file, 'rb') as audio_file:
-            audio_data = base64.b64encode(audio_file.read()).decode('utf-8')
-        
-        # Clean up the file
-        delete_file(output_file)
+        audio_data = base64.b64encode(wav_audio).decode('utf-8')
         
         return jsonify({
             'status': 'success',
@@ -498,7 +918,96 @@ def process_user_input():
         logging.error(f"Error processing user input: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def audio_socket(ws):
+    """
+    Streaming voice turns over a WebSocket (/ws/audio).
+    
+    The client sends 16 kHz 16-bit mono PCM as binary messages (e.g. 20 ms frames)
+    and {"type": "stop"} as text to end the stream; other text frames are ignored.
+    Audio is proxied into a live Deepgram transcription, so each utterance is known
+    as soon as the user stops speaking; the server then sends {"final": true, "text": ...}
+    followed by the reply in the same shape as /api/process_user_input.
+    """
+    session_id = get_session_id()
+    utterances = queue.SimpleQueue()
+    connection, close_transcription = open_live_transcription_with_cached_deepgram(
+        get_cached_deepgram_client(), utterances.put
+    )
+    
+    # Replies are produced on their own thread so audio keeps flowing to Deepgram
+    # while the LLM and TTS work on the previous utterance
+    responder = threading.Thread(target=answer_utterances, args=(ws, session_id, utterances), daemon=True)
+    responder.start()
+    try:
+        while True:
+            message = ws.receive()
+            if isinstance(message, (bytes, bytearray)):
+                connection.send(bytes(message))
+            elif is_stop_message(message):
+                break
+    finally:
+        # Waits for the last transcripts, so a trailing utterance the endpointing
+        # had not closed yet is still answered before the responder stops
+        close_transcription()
+        utterances.put(None)
+    responder.join()
+
+def is_stop_message(message):
+    """Whether a WebSocket text frame is the {"type": "stop"} control message"""
+    try:
+        control = orjson.loads(message)
+    except orjson.JSONDecodeError:
+        return False
+    return isinstance(control, dict) and control.get('type') == 'stop'
+
+def answer_utterances(ws, session_id, utterances):
+    """Reply on the WebSocket to each transcribed utterance, in order, until a None sentinel"""
+    for user_input in iter(utterances.get, None):
+        try:
+            ws.send(orjson.dumps({'final': True, 'text': user_input}).decode('utf-8'))
+            logging.info(f"User: {user_input}")
+            
+            response_text, wav_audio = respond_to_turn(session_id, user_input)
+            logging.info(f"Assistant: {response_text}")
+            ws.send(orjson.dumps({
+                'status': 'success',
+                'user_input': user_input,
+                'assistant_response': response_text,
+                'audio_data': base64.b64encode(wav_audio).decode('utf-8')
+            }).decode('utf-8'))
+        except Exception as e:
+            logging.error(f"Error answering streamed utterance: {e}")
+            try:
+                ws.send(orjson.dumps({'status': 'error', 'message': str(e)}).decode('utf-8'))
+            except Exception:
+                # The socket is gone; nobody is left to answer
+                return
+
+if Sock is not None:
+    Sock(app).route('/ws/audio')(audio_socket)
 
+def serve_with_gunicorn():
+    """
+    Serve the app with gunicorn's threaded worker instead of the Werkzeug dev server.
+    
+    A single worker is used on purpose: sessions and response caches live in process
+    memory, so every request of a conversation must reach the same process.
+    Clients are pre-warmed inside the worker once it has forked.
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    class VoiceAssistantApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', '0.0.0.0:5000')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', 16)
+            self.cfg.set('post_worker_init', lambda worker: init_clients())
+        
+        def load(self):
+            return app
+    
+    VoiceAssistantApplication().run()
 
 if __name__ == '__main__':
     # Validate configuration before starting
@@ -514,8 +1023,9 @@ if __name__ == '__main__':
     print("=" * 60)
     print("⚡ ADVANCED Performance Optimizations Applied:")
     print("  • Connection reuse with cached clients (major latency improvement)")
+    print("  • Clients pre-warmed at startup (no cold first request)")
     print("  • Optimized model parameters for speed")
-    print("  • Thread pool for concurrent processing")
+    print("  • Gunicorn gthread server when installed (Flask dev server otherwise)")
     print("  • Cached API keys for faster access")
     print("  • Fastest models: Deepgram (STT/TTS) + Groq (LLM)")
     print("  • Safe file handling (no quality compromise)")
@@ -531,10 +1041,13 @@ if __name__ == '__main__':
     print("  POST /api/stop_auto_listening   - Stop auto listening")
     print("  POST /api/stop_current_audio    - Stop current audio")
     print("  POST /api/process_user_input    - Process user input")
+    print("  WS   /ws/audio                  - Streaming voice turns")
     print("  POST /transcribe          - Transcribe audio")
     print("  POST /chat                - Text chat")
     print("  POST /tts                 - Text to speech")
+    print("  POST /tts/stream          - Text to speech (binary stream)")
     print("  POST /voice-chat          - Complete voice chat")
+    print("  POST /voice-chat/stream   - Complete voice chat (binary stream)")
     print("  GET  /chat-history        - Get chat history")
     print("  DELETE /chat-history      - Clear chat history")
     print("=" * 60)
@@ -542,6 +1055,16 @@ if __name__ == '__main__':
     print("⚡ Optimized for minimal latency while maintaining quality!")
     print("=" * 60)
     
+    try:
+        serve_with_gunicorn()
+    except ImportError:
+        logging.info("Gunicorn not installed; falling back to the Flask development server")
+    else:
+        exit(0)
+    
+    # Create clients and open connections before accepting requests
+    init_clients()
+    
     # Performance optimized Flask settings
     app.run(
         debug=False,  # Disable debug mode for production performance